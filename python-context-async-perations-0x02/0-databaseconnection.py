@@ -1,22 +1,120 @@
 #!/usr/bin/env python3
+import time
 import sqlite3
+import threading
+
+class ConnectionPool:
+    def __init__(self, db_name, max_size=5, timeout=30):
+        self.db_name = db_name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle = []
+        self.size = 0
+        self.lock = threading.Lock()
+        # Signalled whenever a connection is returned or a slot frees up.
+        self.available = threading.Condition(self.lock)
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self):
+        start = time.perf_counter()
+        waited = False
+        with self.available:
+            while not self.idle and self.size >= self.max_size:
+                remaining = start + self.timeout - time.perf_counter()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        "no connection to {} free after {}s".format(self.db_name, self.timeout))
+                waited = True
+                self.available.wait(remaining)
+            conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                self.size += 1
+            self.checkouts += 1
+            if waited:
+                elapsed = time.perf_counter() - start
+                self.waits += 1
+                self.wait_time += elapsed
+                self.max_wait = max(self.max_wait, elapsed)
+        if conn is None:
+            try:
+                # Connections move between threads, one user at a time.
+                conn = sqlite3.connect(self.db_name, check_same_thread=False)
+            except Exception:
+                self.discarded()
+                raise
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            self.discarded()
+            return
+        with self.available:
+            self.idle.append(conn)
+            self.available.notify()
+
+    def discarded(self):
+        with self.available:
+            self.size -= 1
+            self.available.notify()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "max_size": self.max_size,
+                "idle": len(self.idle),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "avg_wait": self.wait_time / self.waits if self.waits else 0.0,
+                "max_wait": self.max_wait,
+            }
 
 class DatabaseConnection:
-    def __init__(self, db_name):
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def __init__(self, db_name, pooled=False, max_size=5, timeout=30):
         self.db_name = db_name
+        self.pooled = pooled
+        self.max_size = max_size
+        self.timeout = timeout
         self.conn = None
         self.cursor = None
 
+    @classmethod
+    def pool(cls, db_name, max_size=5, timeout=30):
+        with cls.pools_lock:
+            if db_name not in cls.pools:
+                cls.pools[db_name] = ConnectionPool(db_name, max_size, timeout)
+            return cls.pools[db_name]
+
     def __enter__(self):
-        self.conn = sqlite3.connect(self.db_name)
+        if self.pooled:
+            self.conn = self.pool(self.db_name, self.max_size, self.timeout).acquire()
+        else:
+            self.conn = sqlite3.connect(self.db_name)
         self.cursor = self.conn.cursor()
         return self.cursor
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.cursor:
             self.cursor.close()
-        if self.conn:
+        if not self.conn:
+            return
+        if not self.pooled:
             self.conn.close()
+            return
+        # As with close(), whatever was not committed is rolled back, so the
+        # next user never inherits an open transaction.
+        self.pool(self.db_name).release(self.conn)
+        self.conn = None
 
 # Usage example:
 if __name__ == "__main__":
@@ -34,3 +132,10 @@ if __name__ == "__main__":
         results = cursor.fetchall()
         for row in results:
             print(row)
+
+    # Pooled: later uses get the same warm connection back
+    for _ in range(3):
+        with DatabaseConnection(db_file, pooled=True) as cursor:
+            cursor.execute("SELECT COUNT(*) FROM users")
+            print(cursor.fetchone())
+    print(DatabaseConnection.pool(db_file).stats())
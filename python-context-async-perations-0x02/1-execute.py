@@ -1,21 +1,80 @@
 #!/usr/bin/env python3
+import time
 import sqlite3
+from itertools import islice
 
 class ExecuteQuery:
-    def __init__(self, db_name, query, params=None):
+    def __init__(self, db_name, query, params=None, stream=False, arraysize=1000,
+                 many=False, chunk_size=1000):
         self.db_name = db_name
         self.query = query
         self.params = params or []
+        self.stream = stream
+        self.arraysize = arraysize
+        self.many = many
+        self.chunk_size = chunk_size
         self.conn = None
         self.cursor = None
+        self.rows = None
 
     def __enter__(self):
+        try:
+            return self.run()
+        except BaseException:
+            # __exit__ is not called when __enter__ raises.
+            self.__exit__(None, None, None)
+            raise
+
+    def run(self):
         self.conn = sqlite3.connect(self.db_name)
         self.cursor = self.conn.cursor()
+        if self.many:
+            return self.execute_many()
+        self.cursor.arraysize = self.arraysize
         self.cursor.execute(self.query, self.params)
+        if self.stream:
+            # Rows are read arraysize at a time while the with body iterates,
+            # so memory stays flat no matter how large the result is.
+            self.rows = self.iter_rows()
+            return self.rows
         return self.cursor.fetchall()
 
+    def execute_many(self):
+        # params is an iterable of parameter tuples, consumed chunk_size at a
+        # time so a generator of any length never sits in memory at once.
+        # All chunks share one transaction: either every row lands or none.
+        params = iter(self.params)
+        rows = 0
+        submitted = 0
+        start = time.perf_counter()
+        try:
+            self.conn.execute("BEGIN")
+            while True:
+                chunk = list(islice(params, self.chunk_size))
+                if not chunk:
+                    break
+                self.cursor.executemany(self.query, chunk)
+                submitted += len(chunk)
+                # Rows actually changed: INSERT OR IGNORE skips some.
+                rows += max(self.cursor.rowcount, 0)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        seconds = time.perf_counter() - start
+        return {"rows": rows, "submitted": submitted, "seconds": seconds,
+                "rows_per_sec": rows / seconds if seconds else 0.0}
+
+    def iter_rows(self):
+        while True:
+            rows = self.cursor.fetchmany()
+            if not rows:
+                return
+            yield from rows
+
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.rows:
+            self.rows.close()
         if self.cursor:
             self.cursor.close()
         if self.conn:
@@ -38,3 +97,14 @@ if __name__ == "__main__":
     with ExecuteQuery(db_name, query, params) as result:
         for row in result:
             print(row)
+
+    # Batch: bulk insert from a generator in one transaction
+    new_users = ((i, "user{}".format(i), 20 + i % 50) for i in range(100, 1100))
+    with ExecuteQuery(db_name, "INSERT OR REPLACE INTO users (id, name, age) VALUES (?, ?, ?)",
+                      new_users, many=True) as report:
+        print(report)
+
+    # Streaming: same rows, fetched lazily
+    with ExecuteQuery(db_name, query, params, stream=True, arraysize=2) as rows:
+        for row in rows:
+            print(row)
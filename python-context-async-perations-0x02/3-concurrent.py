@@ -1,28 +1,152 @@
 #!/usr/bin/env python3
+import time
 import asyncio
+import sqlite3
+import contextlib
+from dataclasses import dataclass
 import aiosqlite
 
 DB_NAME = "example.db"
 
-async def async_fetch_users():
-    async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute("SELECT * FROM users") as cursor:
-            users = await cursor.fetchall()
-            return users  
+class AsyncConnectionPool:
+    def __init__(self, db_name=DB_NAME, size=5, timeout=30):
+        self.db_name = db_name
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.opened = 0
+        self.available = asyncio.Condition()
 
-async def async_fetch_older_users():
-    async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute("SELECT * FROM users WHERE age > 40") as cursor:
-            older_users = await cursor.fetchall()
-            return older_users  
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def connect(self):
+        db = await aiosqlite.connect(self.db_name)
+        await db.execute("PRAGMA journal_mode = WAL")
+        await db.execute("PRAGMA synchronous = NORMAL")
+        return db
+
+    async def acquire(self):
+        async with self.available:
+            await asyncio.wait_for(
+                self.available.wait_for(lambda: self.idle or self.opened < self.size),
+                self.timeout)
+            if self.idle:
+                return self.idle.pop()
+            self.opened += 1
+        try:
+            return await self.connect()
+        except BaseException:
+            await self.discarded()
+            raise
+
+    async def release(self, db):
+        try:
+            if db.in_transaction:
+                await db.rollback()
+        except sqlite3.Error:
+            try:
+                await db.close()
+            finally:
+                await self.discarded()
+            return
+        async with self.available:
+            self.idle.append(db)
+            self.available.notify()
+
+    async def discarded(self):
+        async with self.available:
+            self.opened -= 1
+            self.available.notify()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        db = await self.acquire()
+        try:
+            yield db
+        finally:
+            await self.release(db)
+
+    async def close(self):
+        # aiosqlite runs each connection on its own thread, which keeps the
+        # interpreter alive until the connection is closed.
+        while self.idle:
+            self.opened -= 1
+            await self.idle.pop().close()
+
+@dataclass
+class QueryResult:
+    index: int
+    value: object = None
+    error: BaseException = None
+    wait: float = 0.0
+    elapsed: float = 0.0
+
+async def run_bounded(jobs, limit=10, timeout=None, fail_fast=False):
+    # Runs jobs (coroutines, or callables returning one) at most `limit` at a
+    # time and yields a QueryResult per job as soon as it finishes, in
+    # completion order. `wait` is time spent queued for a slot, `elapsed` the
+    # time the query itself took. A job that raises or exceeds `timeout` is
+    # yielded with `error` set; with fail_fast the first error cancels the
+    # rest and is raised instead.
+    semaphore = asyncio.Semaphore(limit)
+    finished = asyncio.Queue()
+
+    async def run(index, job):
+        result = QueryResult(index)
+        queued = time.perf_counter()
+        started = None
+        try:
+            async with semaphore:
+                started = time.perf_counter()
+                result.wait = started - queued
+                coro = job() if callable(job) else job
+                result.value = await asyncio.wait_for(coro, timeout)
+        except Exception as e:
+            result.error = e
+        finally:
+            if started is None and asyncio.iscoroutine(job):
+                job.close()
+        result.elapsed = time.perf_counter() - started
+        finished.put_nowait(result)
+
+    tasks = [asyncio.create_task(run(index, job)) for index, job in enumerate(jobs)]
+    try:
+        for _ in range(len(tasks)):
+            result = await finished.get()
+            if fail_fast and result.error is not None:
+                raise result.error
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def fetch_all(query, params=(), pool=None):
+    if pool is None:
+        async with AsyncConnectionPool(size=1) as pool:
+            return await fetch_all(query, params, pool)
+    async with pool.connection() as db:
+        async with db.execute(query, params) as cursor:
+            return await cursor.fetchall()
+
+async def async_fetch_users(pool=None):
+    return await fetch_all("SELECT * FROM users", pool=pool)
+
+async def async_fetch_older_users(pool=None):
+    return await fetch_all("SELECT * FROM users WHERE age > 40", pool=pool)
 
 async def fetch_concurrently():
-    results = await asyncio.gather(
-        async_fetch_users(),           
-        async_fetch_older_users()
-    )
+    results = {}
+    async with AsyncConnectionPool() as pool:
+        queries = [async_fetch_users(pool), async_fetch_older_users(pool)]
+        async for result in run_bounded(queries, limit=pool.size, fail_fast=True):
+            results[result.index] = result.value
 
-    users, older_users = results
+    users, older_users = results[0], results[1]
 
     for user in users:
         print(user)
@@ -33,4 +157,4 @@ async def fetch_concurrently():
         print(user)
 
 if __name__ == "__main__":
-    asyncio.run(fetch_concurrently())  
+    asyncio.run(fetch_concurrently())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import os
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import AsyncMock
+
+module = __import__('3-concurrent')
+AsyncConnectionPool = module.AsyncConnectionPool
+
+
+class TestAsyncConnectionPool(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.directory.name, 'test.db')
+        with sqlite3.connect(self.db_name) as conn:
+            conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, age INTEGER)")
+            conn.executemany("INSERT INTO users (age) VALUES (?)", [(30,), (50,)])
+        conn.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_fan_out_is_bounded_by_pool_size(self):
+        threads = threading.active_count()
+        async with AsyncConnectionPool(self.db_name, size=3) as pool:
+            results = await asyncio.gather(
+                *[module.fetch_all("SELECT * FROM users", pool=pool) for _ in range(40)])
+            self.assertEqual(pool.opened, 3)
+            self.assertLessEqual(threading.active_count() - threads, 3)
+        self.assertEqual(len(results), 40)
+        self.assertEqual(pool.opened, 0)
+
+    async def test_connections_use_wal(self):
+        async with AsyncConnectionPool(self.db_name) as pool:
+            async with pool.connection() as db:
+                async with db.execute("PRAGMA journal_mode") as cursor:
+                    self.assertEqual(await cursor.fetchone(), ("wal",))
+
+    async def test_open_transaction_is_rolled_back(self):
+        async with AsyncConnectionPool(self.db_name, size=1) as pool:
+            async with pool.connection() as db:
+                await db.execute("DELETE FROM users")
+            async with pool.connection() as db:
+                self.assertFalse(db.in_transaction)
+                async with db.execute("SELECT COUNT(*) FROM users") as cursor:
+                    self.assertEqual(await cursor.fetchone(), (2,))
+
+    async def test_failed_rollback_frees_the_slot(self):
+        async with AsyncConnectionPool(self.db_name, size=1, timeout=5) as pool:
+            db = await pool.acquire()
+            waiter = asyncio.ensure_future(pool.acquire())
+            await asyncio.sleep(0.01)
+            broken = AsyncMock(in_transaction=True)
+            broken.rollback.side_effect = sqlite3.OperationalError("disk I/O error")
+            # Released in place of db: the slot frees up without a
+            # connection coming back, and the waiter opens a new one.
+            await pool.release(broken)
+            fresh = await asyncio.wait_for(waiter, 5)
+            self.assertIsNot(fresh, db)
+            broken.close.assert_awaited_once_with()
+            self.assertEqual(pool.opened, 1)
+            await fresh.close()
+            await db.close()
+
+
+class TestRunBounded(unittest.IsolatedAsyncioTestCase):
+    async def job(self, value, delay=0.01, error=None):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            return value
+        finally:
+            self.running -= 1
+
+    def setUp(self):
+        self.running = 0
+        self.peak = 0
+
+    async def test_results_stream_in_completion_order(self):
+        jobs = [self.job(i, delay=0.05 - i * 0.01) for i in range(5)]
+        results = [result async for result in module.run_bounded(jobs, limit=5)]
+        self.assertEqual([result.index for result in results], [4, 3, 2, 1, 0])
+        self.assertEqual([result.value for result in results], [4, 3, 2, 1, 0])
+
+    async def test_concurrency_is_limited_and_wait_is_reported(self):
+        jobs = [self.job(i) for i in range(12)]
+        results = [result async for result in module.run_bounded(jobs, limit=3)]
+        self.assertEqual(self.peak, 3)
+        self.assertEqual(sorted(result.value for result in results), list(range(12)))
+        self.assertGreater(max(result.wait for result in results), 0.02)
+        for result in results:
+            self.assertGreaterEqual(result.elapsed, 0.009)
+
+    async def test_errors_and_timeouts_are_reported(self):
+        jobs = [self.job(0), self.job(1, error=ValueError('boom')), self.job(2, delay=1)]
+        results = {result.index: result
+                   async for result in module.run_bounded(jobs, limit=3, timeout=0.1)}
+        self.assertEqual(results[0].value, 0)
+        self.assertIsInstance(results[1].error, ValueError)
+        self.assertIsInstance(results[2].error, asyncio.TimeoutError)
+
+    async def test_fail_fast_cancels_the_rest(self):
+        started = []
+
+        def job(i):
+            async def run():
+                started.append(i)
+                if i == 1:
+                    raise ValueError('boom')
+                await asyncio.sleep(1)
+            return run
+
+        with self.assertRaises(ValueError):
+            async for _ in module.run_bounded([job(i) for i in range(10)], limit=2,
+                                              fail_fast=True):
+                pass
+        self.assertLess(len(started), 10)
+        self.assertEqual(self.running, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock
+
+module = __import__('0-databaseconnection')
+ConnectionPool = module.ConnectionPool
+DatabaseConnection = module.DatabaseConnection
+
+
+class TestPooledDatabaseConnection(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.directory.name, 'test.db')
+        with sqlite3.connect(self.db_name) as conn:
+            conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.close()
+
+    def tearDown(self):
+        pool = DatabaseConnection.pools.pop(self.db_name, None)
+        if pool is not None:
+            for conn in pool.idle:
+                conn.close()
+        self.directory.cleanup()
+
+    def count(self):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_connection_is_reused(self):
+        with DatabaseConnection(self.db_name, pooled=True) as cursor:
+            first = cursor.connection
+        with DatabaseConnection(self.db_name, pooled=True) as cursor:
+            self.assertIs(cursor.connection, first)
+        self.assertEqual(DatabaseConnection.pool(self.db_name).stats()["size"], 1)
+
+    def test_uncommitted_writes_are_discarded_like_unpooled(self):
+        for pooled in (False, True):
+            with DatabaseConnection(self.db_name, pooled=pooled) as cursor:
+                cursor.execute("INSERT INTO users (name) VALUES ('a')")
+            self.assertEqual(self.count(), 0)
+
+    def test_committed_writes_persist(self):
+        with DatabaseConnection(self.db_name, pooled=True) as cursor:
+            cursor.execute("INSERT INTO users (name) VALUES ('a')")
+            cursor.connection.commit()
+        self.assertEqual(self.count(), 1)
+
+    def test_exception_rolls_back(self):
+        with self.assertRaises(ValueError):
+            with DatabaseConnection(self.db_name, pooled=True) as cursor:
+                cursor.execute("INSERT INTO users (name) VALUES ('a')")
+                raise ValueError
+        with DatabaseConnection(self.db_name, pooled=True) as cursor:
+            self.assertFalse(cursor.connection.in_transaction)
+        self.assertEqual(self.count(), 0)
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.directory.name, 'test.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_times_out_when_exhausted(self):
+        pool = ConnectionPool(self.db_name, max_size=1, timeout=0.05)
+        conn = pool.acquire()
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        conn.close()
+
+    def test_waiter_gets_released_connection(self):
+        pool = ConnectionPool(self.db_name, max_size=1, timeout=5)
+        conn = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, (conn,))
+        timer.start()
+        self.assertIs(pool.acquire(), conn)
+        stats = pool.stats()
+        self.assertEqual(stats["waits"], 1)
+        self.assertGreater(stats["max_wait"], 0.0)
+        conn.close()
+
+    def test_discarded_connection_wakes_waiter(self):
+        pool = ConnectionPool(self.db_name, max_size=1, timeout=5)
+        conn = pool.acquire()
+        broken = Mock(in_transaction=True)
+        broken.rollback.side_effect = sqlite3.OperationalError("disk I/O error")
+        # The slot frees up without a connection coming back; the waiter
+        # must open a new one instead of timing out.
+        timer = threading.Timer(0.05, pool.release, (broken,))
+        timer.start()
+        fresh = pool.acquire()
+        self.assertIsNot(fresh, conn)
+        broken.close.assert_called_once_with()
+        self.assertEqual(pool.stats()["size"], 1)
+        fresh.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+module = __import__('1-execute')
+ExecuteQuery = module.ExecuteQuery
+
+INSERT = "INSERT OR IGNORE INTO users (id, name) VALUES (?, ?)"
+
+
+class TestExecuteQuery(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.directory.name, 'test.db')
+        with sqlite3.connect(self.db_name) as conn:
+            conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+            conn.executemany("INSERT INTO users VALUES (?, ?)", [(1, 'a'), (2, 'b'), (3, 'c')])
+        conn.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def count(self):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_fetchall(self):
+        with ExecuteQuery(self.db_name, "SELECT name FROM users WHERE id > ?", [1]) as rows:
+            self.assertEqual(rows, [('b',), ('c',)])
+
+    def test_stream(self):
+        query = ExecuteQuery(self.db_name, "SELECT id FROM users ORDER BY id", stream=True,
+                             arraysize=2)
+        with query as rows:
+            self.assertEqual(next(rows), (1,))
+            self.assertEqual(list(rows), [(2,), (3,)])
+        with self.assertRaises(sqlite3.ProgrammingError):
+            query.cursor.fetchone()
+
+    def test_many_reports_rows_written(self):
+        params = ((i, 'user{}'.format(i)) for i in range(2, 10))
+        with ExecuteQuery(self.db_name, INSERT, params, many=True, chunk_size=3) as report:
+            pass
+        self.assertEqual(report["submitted"], 8)
+        self.assertEqual(report["rows"], 6)
+        self.assertEqual(self.count(), 9)
+
+    def test_failed_many_rolls_back_and_closes(self):
+        params = [(10, 'x'), (11, 'y'), (1, None, 'too many')]
+        connections = []
+        connect = sqlite3.connect
+
+        def tracked_connect(*args, **kwargs):
+            connections.append(connect(*args, **kwargs))
+            return connections[-1]
+
+        with patch.object(module.sqlite3, 'connect', tracked_connect):
+            with self.assertRaises(sqlite3.ProgrammingError):
+                with ExecuteQuery(self.db_name, INSERT, params, many=True, chunk_size=2):
+                    pass
+        self.assertEqual(self.count(), 3)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connections[0].execute("SELECT 1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,200 @@
 #!/usr/bin/env python3
+import re
+import math
+import time
+import atexit
+import random
+import inspect
+import sqlite3
+import logging
+import functools
+import threading
+from collections import deque, defaultdict
+from datetime import datetime
 
-# ["from datetime import datetime", "print", "connect"]
+import profiler
+
+BUFFER_SIZE = 10000
+SAMPLE_RATE = 1.0
+FLUSH_INTERVAL = 1.0
+SLOW_QUERY_SECONDS = 0.5
+
+logger = logging.getLogger('query_log')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def fingerprint(sql):
+    # Queries that differ only in literal values share a fingerprint.
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(?+)', sql)
+    return re.sub(r'\s+', ' ', sql).strip().rstrip(';').lower()
+
+
+class LatencyHistogram:
+    # Log-scale buckets, each 10% wider than the last, so percentiles are
+    # accurate to ~10% at any magnitude with a few dozen integers of state.
+    GROWTH = 1.1
+    FLOOR = 1e-6
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    def record(self, seconds, rows=None):
+        index = math.ceil(math.log(max(seconds, self.FLOOR) / self.FLOOR, self.GROWTH))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if rows is not None:
+            self.rows += rows
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100.0)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.FLOOR * self.GROWTH ** index, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+            'rows': self.rows,
+        }
+
+
+class QueryLog:
+    def __init__(self, capacity=BUFFER_SIZE, sample_rate=SAMPLE_RATE,
+                 flush_interval=FLUSH_INTERVAL, slow_query_seconds=SLOW_QUERY_SECONDS):
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.slow_query_seconds = slow_query_seconds
+        # Bounded ring buffer: when the flusher falls behind, the oldest
+        # samples are overwritten instead of the caller blocking.
+        self._buffer = deque(maxlen=capacity)
+        self._histograms = defaultdict(LatencyHistogram)
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def record(self, sql, seconds, rows=None):
+        # Hot path: one tuple appended to a deque; fingerprinting and
+        # aggregation happen on the flusher thread.
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self._buffer.append((time.time(), sql, seconds, rows))
+        if self._flusher is None:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='query-log-flusher',
+                                                 daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            while True:
+                try:
+                    started, sql, seconds, rows = self._buffer.popleft()
+                except IndexError:
+                    return
+                self._histograms[fingerprint(sql)].record(seconds, rows)
+                if seconds >= self.slow_query_seconds:
+                    logger.warning('%s slow query (%.3fs, %s rows): %s',
+                                   datetime.fromtimestamp(started).isoformat(),
+                                   seconds, rows, sql)
+
+    def stats(self):
+        self.flush()
+        with self._lock:
+            return {fp: histogram.summary() for fp, histogram in self._histograms.items()}
+
+    def reset(self):
+        with self._lock:
+            self._buffer.clear()
+            self._histograms.clear()
+
+
+query_log = QueryLog()
+atexit.register(query_log.flush)
+
+
+def _find_query(args, kwargs):
+    if isinstance(kwargs.get('query'), str):
+        return kwargs['query']
+    return next((arg for arg in args if isinstance(arg, str)), None)
+
+
+def log_queries(func):
+    func = profiler.leaf(func)
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            query = _find_query(args, kwargs)
+            if query is None:
+                return await func(*args, **kwargs)
+            rows = None
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+                if isinstance(result, list):
+                    rows = len(result)
+                return result
+            finally:
+                query_log.record(query, time.perf_counter() - start, rows)
+        return profiler.layer('log_queries', async_wrapper)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        query = _find_query(args, kwargs)
+        if query is None:
+            return func(*args, **kwargs)
+        rows = None
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            if isinstance(result, list):
+                rows = len(result)
+            return result
+        finally:
+            query_log.record(query, time.perf_counter() - start, rows)
+    return profiler.layer('log_queries', wrapper)
+
+
+@log_queries
+def fetch_all_users(query):
+    conn = sqlite3.connect('users.db')
+    cursor = conn.cursor()
+    cursor.execute(query)
+    results = cursor.fetchall()
+    conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    #### fetch users while logging the query
+    users = fetch_all_users(query="SELECT * FROM users")
+    for fp, summary in query_log.stats().items():
+        print(fp, summary)
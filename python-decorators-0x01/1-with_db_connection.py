@@ -1 +1,426 @@
 #!/usr/bin/env python3
+import time
+import asyncio
+import inspect
+import sqlite3
+import functools
+import threading
+import contextlib
+import weakref
+from collections import OrderedDict
+
+import profiler
+
+try:
+    import aiosqlite
+except ImportError:  # only needed when decorating async def functions
+    aiosqlite = None
+
+DB_NAME = 'users.db'
+POOL_SIZE = 5
+CHECKOUT_TIMEOUT = 30
+STATEMENT_CACHE_SIZE = 256
+# Applied once per connection when it is opened, not on every checkout.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,
+}
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    pass
+
+
+class StatementCache:
+    # sqlite3 already keeps each connection's prepared statements in an LRU
+    # keyed by SQL text (sized by cached_statements), so a repeated query
+    # skips parsing and planning. That cache is not observable from Python;
+    # this mirrors its bookkeeping so hit rates can be reported and the
+    # size tuned.
+    def __init__(self, size):
+        self.size = size
+        self._keys = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def touch(self, sql):
+        if sql in self._keys:
+            self._keys.move_to_end(sql)
+            self.hits += 1
+            return
+        self.misses += 1
+        if self.size <= 0:
+            return
+        self._keys[sql] = None
+        if len(self._keys) > self.size:
+            self._keys.popitem(last=False)
+            self.evictions += 1
+
+
+class StatementCachingCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=(), /):
+        self.connection.statement_cache.touch(sql)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        self.connection.statement_cache.touch(sql)
+        return super().executemany(sql, seq_of_parameters)
+
+
+class StatementCachingConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statement_cache = StatementCache(kwargs.get('cached_statements', 128))
+
+    def cursor(self, factory=StatementCachingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=(), /):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _tracked_connection_class(connections):
+    # A per-pool subclass that registers every connection it creates, so the
+    # pool can aggregate statement-cache stats for sync and async alike.
+    class TrackedConnection(StatementCachingConnection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            connections.add(self)
+    return TrackedConnection
+
+
+def _statement_stats(connections):
+    caches = [conn.statement_cache for conn in connections]
+    hits = sum(c.hits for c in caches)
+    misses = sum(c.misses for c in caches)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'evictions': sum(c.evictions for c in caches),
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+    }
+
+
+class ConnectionPool:
+    def __init__(self, database=DB_NAME, size=POOL_SIZE, pragmas=None,
+                 timeout=CHECKOUT_TIMEOUT, statement_cache_size=STATEMENT_CACHE_SIZE):
+        self.database = database
+        self.size = size
+        self.pragmas = dict(PRAGMAS if pragmas is None else pragmas)
+        self.timeout = timeout
+        self.statement_cache_size = statement_cache_size
+        self._connections = weakref.WeakSet()
+        self._factory = _tracked_connection_class(self._connections)
+        self._idle = []
+        self._lock = threading.Lock()
+        # Notified when a connection comes back or a slot frees up, so a
+        # waiter can take the connection or open a new one.
+        self._available = threading.Condition(self._lock)
+        self._opened = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _connect(self):
+        # check_same_thread is off because a connection moves between threads
+        # over its lifetime; the pool guarantees one user at a time.
+        conn = sqlite3.connect(self.database, check_same_thread=False,
+                               factory=self._factory,
+                               cached_statements=self.statement_cache_size)
+        for name, value in self.pragmas.items():
+            conn.execute('PRAGMA {} = {}'.format(name, value))
+        return conn
+
+    def acquire(self):
+        start = time.perf_counter()
+        waited = False
+        with self._available:
+            while not self._idle and self._opened >= self.size:
+                remaining = start + self.timeout - time.perf_counter()
+                if remaining <= 0:
+                    raise PoolTimeout('no connection free after {}s'.format(self.timeout))
+                waited = True
+                self._available.wait(remaining)
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._opened += 1
+            elapsed = time.perf_counter() - start
+            self.checkouts += 1
+            self.waits += waited
+            self.wait_total += elapsed
+            self.wait_max = max(self.wait_max, elapsed)
+        if conn is None:
+            try:
+                conn = self._connect()
+            except BaseException:
+                self._slot_freed()
+                raise
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._available:
+            self._idle.append(conn)
+            self._available.notify()
+
+    def _discard(self, conn):
+        self._slot_freed()
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _slot_freed(self):
+        with self._available:
+            self._opened -= 1
+            self._available.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._opened,
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_avg': self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'wait_max': self.wait_max,
+                'statements': _statement_stats(list(self._connections)),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure_pool(**settings):
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, ConnectionPool(**settings)
+    if old is not None:
+        old.close()
+    return _pool
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+class AsyncConnectionPool:
+    # asyncio counterpart of ConnectionPool over aiosqlite. Lives on the event
+    # loop that first used it.
+    def __init__(self, database=DB_NAME, size=POOL_SIZE, pragmas=None,
+                 timeout=CHECKOUT_TIMEOUT, statement_cache_size=STATEMENT_CACHE_SIZE):
+        if aiosqlite is None:
+            raise ImportError('aiosqlite is required for async database functions')
+        self.database = database
+        self.size = size
+        self.pragmas = dict(PRAGMAS if pragmas is None else pragmas)
+        self.timeout = timeout
+        self.statement_cache_size = statement_cache_size
+        self._connections = weakref.WeakSet()
+        self._factory = _tracked_connection_class(self._connections)
+        self.loop = asyncio.get_running_loop()
+        self._idle = []
+        self._available = asyncio.Condition()
+        self._opened = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.database, factory=self._factory,
+                                       cached_statements=self.statement_cache_size)
+        for name, value in self.pragmas.items():
+            await conn.execute('PRAGMA {} = {}'.format(name, value))
+        return conn
+
+    def _can_checkout(self):
+        return self._idle or self._opened < self.size
+
+    async def acquire(self):
+        start = time.perf_counter()
+        async with self._available:
+            waited = not self._can_checkout()
+            try:
+                await asyncio.wait_for(self._available.wait_for(self._can_checkout),
+                                       self.timeout)
+            except asyncio.TimeoutError:
+                raise PoolTimeout('no connection free after {}s'.format(self.timeout))
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._opened += 1
+        elapsed = time.perf_counter() - start
+        self.checkouts += 1
+        self.waits += waited
+        self.wait_total += elapsed
+        self.wait_max = max(self.wait_max, elapsed)
+        if conn is None:
+            try:
+                conn = await self._connect()
+            except BaseException:
+                await self._slot_freed()
+                raise
+        return conn
+
+    async def release(self, conn):
+        try:
+            if conn.in_transaction:
+                await conn.rollback()
+        except sqlite3.Error:
+            try:
+                await conn.close()
+            finally:
+                await self._slot_freed()
+            return
+        async with self._available:
+            self._idle.append(conn)
+            self._available.notify()
+
+    async def _slot_freed(self):
+        # Wakes a waiter so it can open a replacement connection.
+        async with self._available:
+            self._opened -= 1
+            self._available.notify()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    async def close(self):
+        while self._idle:
+            self._opened -= 1
+            await self._idle.pop().close()
+
+    def abandon(self):
+        # For a pool whose event loop is gone: nothing can be awaited any
+        # more, so just stop the idle connections' worker threads.
+        while self._idle:
+            self._opened -= 1
+            self._idle.pop().stop()
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'open': self._opened,
+            'idle': len(self._idle),
+            'checkouts': self.checkouts,
+            'waits': self.waits,
+            'wait_avg': self.wait_total / self.checkouts if self.checkouts else 0.0,
+            'wait_max': self.wait_max,
+            'statements': _statement_stats(list(self._connections)),
+        }
+
+
+_async_pool = None
+_async_settings = {}
+
+
+async def _closed_at_shutdown(pool):
+    # Parked at its yield until the event loop finalizes async generators,
+    # which asyncio.run() does before closing the loop. Each idle aiosqlite
+    # connection has a worker thread that would otherwise keep the
+    # interpreter alive at exit.
+    try:
+        yield
+    finally:
+        await pool.close()
+
+
+def _close_at_loop_shutdown(pool):
+    pool._closer = _closed_at_shutdown(pool)
+    pool.loop.create_task(pool._closer.__anext__())
+    return pool
+
+
+async def configure_async_pool(**settings):
+    global _async_pool
+    _async_settings.clear()
+    _async_settings.update(settings)
+    old, _async_pool = _async_pool, _close_at_loop_shutdown(AsyncConnectionPool(**settings))
+    if old is not None and old.loop is _async_pool.loop:
+        await old.close()
+    elif old is not None:
+        old.abandon()
+    return _async_pool
+
+
+def get_async_pool():
+    global _async_pool
+    if _async_pool is None or _async_pool.loop is not asyncio.get_running_loop():
+        if _async_pool is not None:
+            _async_pool.abandon()
+        _async_pool = _close_at_loop_shutdown(AsyncConnectionPool(**_async_settings))
+    return _async_pool
+
+
+async def close_async_pool():
+    # For loops not run by asyncio.run(), or to close the pool early.
+    global _async_pool
+    pool, _async_pool = _async_pool, None
+    if pool is not None:
+        await pool.close()
+
+
+def with_db_connection(func):
+    # Works for plain and async def functions alike; async ones get an
+    # aiosqlite connection from the async pool.
+    func = profiler.leaf(func)
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            async with get_async_pool().connection() as conn:
+                return await func(conn, *args, **kwargs)
+        return profiler.layer('with_db_connection', async_wrapper)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with get_pool().connection() as conn:
+            return func(conn, *args, **kwargs)
+    return profiler.layer('with_db_connection', wrapper)
+
+
+@with_db_connection
+def get_user_by_id(conn, user_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+    return cursor.fetchone()
+
+
+if __name__ == "__main__":
+    user = get_user_by_id(user_id=1)
+    print(user)
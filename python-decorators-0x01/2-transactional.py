@@ -1 +1,321 @@
 #!/usr/bin/env python3
+import time
+import inspect
+import logging
+import sqlite3
+import functools
+import threading
+
+import profiler
+
+connection_module = __import__('1-with_db_connection')
+with_db_connection = connection_module.with_db_connection
+
+logger = logging.getLogger('group_commit')
+
+# Called with the list of SQL statements of every committed transaction,
+# e.g. so the query cache can evict what those writes made stale.
+commit_hooks = []
+
+# Nesting depth of transactional calls per connection. A connection has one
+# user at a time (the pool guarantees it), so no lock is needed.
+_depths = {}
+
+
+def on_commit(hook):
+    commit_hooks.append(hook)
+    return hook
+
+
+def _run_commit_hooks(statements):
+    for hook in commit_hooks:
+        hook(statements)
+
+
+def _in_savepoint(conn, name, func, args, kwargs):
+    conn.execute('SAVEPOINT ' + name)
+    try:
+        result = func(conn, *args, **kwargs)
+    except Exception:
+        conn.execute('ROLLBACK TO ' + name)
+        conn.execute('RELEASE ' + name)
+        raise
+    conn.execute('RELEASE ' + name)
+    return result
+
+
+async def _in_savepoint_async(conn, name, func, args, kwargs):
+    await conn.execute('SAVEPOINT ' + name)
+    try:
+        result = await func(conn, *args, **kwargs)
+    except Exception:
+        await conn.execute('ROLLBACK TO ' + name)
+        await conn.execute('RELEASE ' + name)
+        raise
+    await conn.execute('RELEASE ' + name)
+    return result
+
+
+def transactional(func):
+    # The outermost call owns the transaction and commits or rolls it back;
+    # nested calls on the same connection run inside a SAVEPOINT so a
+    # failing inner call undoes only its own work.
+    func = profiler.leaf(func)
+    if inspect.iscoroutinefunction(func):
+        return profiler.layer('transactional', _async_transactional(func))
+
+    @functools.wraps(func)
+    def wrapper(conn, *args, **kwargs):
+        key = id(conn)
+        depth = _depths.get(key, 0)
+        if depth:
+            _depths[key] = depth + 1
+            try:
+                return _in_savepoint(conn, 'sp_{}'.format(depth), func, args, kwargs)
+            finally:
+                _depths[key] = depth
+
+        statements = []
+        _depths[key] = 1
+        conn.set_trace_callback(statements.append)
+        try:
+            if not conn.in_transaction:
+                conn.execute('BEGIN')
+            result = func(conn, *args, **kwargs)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.set_trace_callback(None)
+            del _depths[key]
+        _run_commit_hooks(statements)
+        return result
+    return profiler.layer('transactional', wrapper)
+
+
+def _async_transactional(func):
+    @functools.wraps(func)
+    async def wrapper(conn, *args, **kwargs):
+        key = id(conn)
+        depth = _depths.get(key, 0)
+        if depth:
+            _depths[key] = depth + 1
+            try:
+                return await _in_savepoint_async(conn, 'sp_{}'.format(depth), func, args, kwargs)
+            finally:
+                _depths[key] = depth
+
+        statements = []
+        _depths[key] = 1
+        await conn.set_trace_callback(statements.append)
+        try:
+            if not conn.in_transaction:
+                await conn.execute('BEGIN')
+            result = await func(conn, *args, **kwargs)
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+        finally:
+            await conn.set_trace_callback(None)
+            del _depths[key]
+        _run_commit_hooks(statements)
+        return result
+    return wrapper
+
+
+class GroupCommit:
+    # Opt-in group commit: every function decorated with the same GroupCommit
+    # runs on one dedicated connection inside a shared transaction, each call
+    # in its own SAVEPOINT. The transaction commits once max_batch writes have
+    # accumulated or the oldest has waited max_latency seconds, so N small
+    # writes cost one fsync instead of N.
+    #
+    # With wait=False a call returns once its savepoint is released and its
+    # write becomes durable at the next group commit (use flush() to force
+    # one). With wait=True the call blocks until its batch has committed.
+    # While a batch is open it holds SQLite's write lock, so other writers
+    # wait up to max_latency.
+    def __init__(self, database=None, max_batch=100, max_latency=0.05, wait=False):
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.wait = wait
+        self._pool = connection_module.ConnectionPool(
+            database=database or connection_module.DB_NAME, size=1)
+        self._conn = None
+        self._lock = threading.RLock()
+        self._committed = threading.Condition(self._lock)
+        self._batch = 0
+        self._failed = {}
+        self._pending = 0
+        self._opened_at = None
+        self._statements = []
+        # Statements of committed batches whose on_commit hooks have not run
+        # yet; hooks run after self._lock is released, see _run_hooks.
+        self._hooks_due = []
+        self._closed = False
+        self._flusher = None
+        self.started = time.monotonic()
+        self.commits = 0
+        self.writes = 0
+        self.failed_commits = 0
+
+    def __call__(self, func):
+        if inspect.iscoroutinefunction(func):
+            raise TypeError('GroupCommit only wraps synchronous functions')
+        func = profiler.leaf(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self._lock:
+                conn = self._begin()
+                _depths[id(conn)] = 1
+                try:
+                    result = _in_savepoint(conn, 'group_write', func, args, kwargs)
+                finally:
+                    del _depths[id(conn)]
+                self._pending += 1
+                self.writes += 1
+                batch = self._batch
+                if self._pending >= self.max_batch:
+                    self._flush()
+                elif self.wait:
+                    while self._batch == batch:
+                        self._committed.wait()
+                error = self._batch_error(batch) if self.wait else None
+            self._run_hooks()
+            if error is not None:
+                raise error
+            return result
+        return profiler.layer('group_commit', wrapper)
+
+    def _begin(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError('GroupCommit is closed')
+        if self._conn is None:
+            self._conn = self._pool.acquire()
+        if not self._conn.in_transaction:
+            self._statements = []
+            self._conn.set_trace_callback(self._statements.append)
+            self._conn.execute('BEGIN')
+            self._opened_at = time.monotonic()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._run, name='group-commit', daemon=True)
+            self._flusher.start()
+        return self._conn
+
+    def _run(self):
+        # Nothing may end this loop but close(): a dead flusher would leave
+        # wait=True callers blocked and the write lock held for good.
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                if (self._opened_at is not None
+                        and time.monotonic() - self._opened_at >= self.max_latency):
+                    try:
+                        self._flush()
+                    except Exception:
+                        logger.exception('group commit flush failed')
+                self._committed.wait(self.max_latency)
+            self._run_hooks()
+
+    def _flush(self):
+        # Also runs when every call in the batch failed: the transaction is
+        # still open and holding the write lock.
+        if self._opened_at is None:
+            return None
+        statements = self._statements
+        error = None
+        try:
+            self._conn.commit()
+            self.commits += 1
+        except sqlite3.Error as e:
+            self.failed_commits += 1
+            error = e
+            statements = []
+            if self.wait and self._pending:
+                # Raised to each of the batch's callers; see _batch_error.
+                self._failed[self._batch] = [e, self._pending]
+            try:
+                self._conn.rollback()
+            except sqlite3.Error:
+                # The pool discards it; the next write opens a new one.
+                logger.exception('group commit rollback failed')
+                self._pool.release(self._conn)
+                self._conn = None
+        finally:
+            if self._conn is not None:
+                self._conn.set_trace_callback(None)
+            self._opened_at = None
+            self._pending = 0
+            self._batch += 1
+            self._committed.notify_all()
+        if statements:
+            self._hooks_due.append(statements)
+        return error
+
+    def _run_hooks(self):
+        # Called without self._lock held, so a slow or failing hook neither
+        # stalls the next batch nor reaches the writer whose commit succeeded.
+        with self._lock:
+            due, self._hooks_due = self._hooks_due, []
+        for statements in due:
+            try:
+                _run_commit_hooks(statements)
+            except Exception:
+                logger.exception('on_commit hook failed')
+
+    def _batch_error(self, batch):
+        # Every caller of a failed batch gets its error, including the one
+        # that flushed it inline; the last one to look drops the entry.
+        entry = self._failed.get(batch)
+        if entry is None:
+            return None
+        entry[1] -= 1
+        if not entry[1]:
+            del self._failed[batch]
+        return entry[0]
+
+    def flush(self):
+        with self._lock:
+            error = self._flush()
+        self._run_hooks()
+        if error is not None:
+            raise error
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._closed = True
+            self._committed.notify_all()
+            if self._conn is not None:
+                self._pool.release(self._conn)
+                self._conn = None
+        self._run_hooks()
+        self._pool.close()
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                'writes': self.writes,
+                'commits': self.commits,
+                'failed_commits': self.failed_commits,
+                'pending': self._pending,
+                'writes_per_commit': self.writes / self.commits if self.commits else 0.0,
+                'commits_per_sec': self.commits / elapsed if elapsed else 0.0,
+            }
+
+
+@with_db_connection
+@transactional
+def update_user_email(conn, user_id, new_email):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+
+
+if __name__ == "__main__":
+    #### Update user's email with automatic transaction handling
+    update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
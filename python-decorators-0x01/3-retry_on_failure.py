@@ -1 +1,236 @@
 #!/usr/bin/env python3
+import time
+import random
+import asyncio
+import inspect
+import sqlite3
+import functools
+import threading
+from collections import deque
+
+import profiler
+
+with_db_connection = __import__('1-with_db_connection').with_db_connection
+
+TRANSIENT_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')
+
+
+class CircuitOpenError(sqlite3.OperationalError):
+    pass
+
+
+def is_transient(error):
+    # Only lock contention is worth retrying; a syntax error or a missing
+    # table fails the same way no matter how long we wait.
+    return (isinstance(error, sqlite3.OperationalError)
+            and any(m in str(error).lower() for m in TRANSIENT_MESSAGES))
+
+
+class RetryBudget:
+    # Token bucket shared by every caller: each call earns `ratio` of a
+    # retry, each retry spends one. Retries stay a bounded fraction of
+    # traffic instead of multiplying load during an outage.
+    def __init__(self, ratio=0.2, initial=10, capacity=100):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.tokens = float(initial)
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                self.exhausted += 1
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    # Returned by allow() to the one caller that gets to probe a half-open
+    # circuit; truthy like True.
+    TRIAL = 'trial'
+
+    def __init__(self, failure_rate=0.5, min_calls=20, window=10.0, reset_timeout=5.0):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.rejected = 0
+        self._outcomes = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                # Let a single probe through; everyone else keeps failing fast.
+                self._trial_running = True
+                return self.TRIAL
+            self.rejected += 1
+            return False
+
+    def record(self, ok):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+                if ok:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+                else:
+                    self._open(now)
+                return
+            self._outcomes.append((now, ok))
+            self._failures += not ok
+            while self._outcomes and now - self._outcomes[0][0] > self.window:
+                self._failures -= not self._outcomes.popleft()[1]
+            calls = len(self._outcomes)
+            if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+                self._open(now)
+
+    def abandon(self):
+        # The probe ended without an outcome (KeyboardInterrupt, task
+        # cancelled): let the next caller probe instead.
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self._failures = 0
+
+    def stats(self):
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                'state': self.state,
+                'calls': calls,
+                'failure_rate': self._failures / calls if calls else 0.0,
+                'rejected': self.rejected,
+            }
+
+
+default_breaker = CircuitBreaker()
+default_budget = RetryBudget()
+
+
+def retry_on_failure(retries=3, delay=1, max_delay=30, transient=is_transient,
+                     breaker=default_breaker, budget=default_budget):
+    # Exponential backoff with full jitter: attempt n sleeps a random time in
+    # [0, min(max_delay, delay * 2**n)], so callers that failed together do
+    # not come back together. Pass breaker=None or budget=None to opt out.
+    # async def functions are retried with asyncio.sleep.
+    def before_attempt():
+        # True when this attempt is the half-open probe.
+        if breaker is None:
+            return False
+        allowed = breaker.allow()
+        if not allowed:
+            raise CircuitOpenError('circuit open: database calls are failing fast')
+        return allowed == breaker.TRIAL
+
+    def interrupted(probing):
+        if probing:
+            breaker.abandon()
+
+    def succeeded():
+        if breaker is not None:
+            breaker.record(True)
+
+    def backoff(error, attempt):
+        # Seconds to sleep before the next attempt, or None to give up.
+        failed = transient(error)
+        if breaker is not None:
+            # Non-transient errors still mean the database answered.
+            breaker.record(not failed)
+            if breaker.state == breaker.OPEN:
+                # The next attempt would only fail fast; raise the real
+                # error now instead of sleeping and spending budget on it.
+                return None
+        if (not failed or attempt >= retries
+                or (budget is not None and not budget.withdraw())):
+            return None
+        return random.uniform(0, min(max_delay, delay * 2 ** attempt))
+
+    def decorator(func):
+        func = profiler.leaf(func)
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if budget is not None:
+                    budget.deposit()
+                attempt = 0
+                while True:
+                    probing = before_attempt()
+                    try:
+                        result = await func(*args, **kwargs)
+                    except Exception as e:
+                        pause = backoff(e, attempt)
+                        if pause is None:
+                            raise
+                        await asyncio.sleep(pause)
+                        attempt += 1
+                        continue
+                    except BaseException:
+                        interrupted(probing)
+                        raise
+                    succeeded()
+                    return result
+            return profiler.layer('retry_on_failure', async_wrapper)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if budget is not None:
+                budget.deposit()
+            attempt = 0
+            while True:
+                probing = before_attempt()
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    pause = backoff(e, attempt)
+                    if pause is None:
+                        raise
+                    time.sleep(pause)
+                    attempt += 1
+                    continue
+                except BaseException:
+                    interrupted(probing)
+                    raise
+                succeeded()
+                return result
+        return profiler.layer('retry_on_failure', wrapper)
+    return decorator
+
+
+@with_db_connection
+@retry_on_failure(retries=3, delay=1)
+def fetch_users_with_retry(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users")
+    return cursor.fetchall()
+
+
+if __name__ == "__main__":
+    #### attempt to fetch users with automatic retry on failure
+    users = fetch_users_with_retry()
+    print(users)
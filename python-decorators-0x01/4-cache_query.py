@@ -1 +1,512 @@
 #!/usr/bin/env python3
+import os
+import re
+import sys
+import time
+import json
+import atexit
+import base64
+import asyncio
+import inspect
+import functools
+import tempfile
+import threading
+import concurrent.futures
+from collections import OrderedDict, defaultdict
+
+import profiler
+
+connection_module = __import__('1-with_db_connection')
+with_db_connection = connection_module.with_db_connection
+transactional_module = __import__('2-transactional')
+
+ALL_TABLES = '*'
+SNAPSHOT_ENTRIES = 256
+
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_TABLE = r'[\w."`\[\]]+'
+_READ_TABLES = re.compile(r'\b(?:from|join)\s+(' + _TABLE + ')')
+# FROM a, b AS x, c y: every table of a comma join, not just the first.
+_FROM_LIST = re.compile(
+    r'\bfrom\s+((?:' + _TABLE + r'(?:\s+(?:as\s+)?\w+)?\s*,\s*)+' + _TABLE + ')')
+# FROM (SELECT ...) x, ...: tables after a subquery are not parsed.
+_FROM_SUBQUERY = re.compile(r'\bfrom\s*\(')
+_WRITE_TABLES = re.compile(
+    r'\b(?:insert(?:\s+or\s+\w+)?\s+into|replace\s+into|'
+    r'update(?:\s+or\s+\w+)?|delete\s+from)\s+([\w."`\[\]]+)')
+_SCHEMA_CHANGE = re.compile(r'^\s*(?:create|drop|alter|vacuum|attach|detach)\b')
+
+
+def normalize_sql(sql):
+    # Same statement, same key: case and whitespace outside string literals
+    # do not matter, a trailing semicolon does not either.
+    parts = _LITERAL.split(sql.strip().rstrip(';').strip())
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r'\s+', ' ', parts[i].lower())
+    return ''.join(parts)
+
+
+def _table_name(raw):
+    return raw.strip('"`[]').split('.')[-1].strip('"`[]')
+
+
+def tables_read(sql):
+    sql = normalize_sql(sql)
+    if _FROM_SUBQUERY.search(sql):
+        return {ALL_TABLES}
+    tables = {_table_name(t) for t in _READ_TABLES.findall(sql)}
+    for from_list in _FROM_LIST.findall(sql):
+        tables.update(_table_name(item.split()[0]) for item in from_list.split(','))
+    return tables or {ALL_TABLES}
+
+
+def tables_written(sql):
+    sql = normalize_sql(sql)
+    if _SCHEMA_CHANGE.match(sql):
+        return {ALL_TABLES}
+    return {_table_name(t) for t in _WRITE_TABLES.findall(sql)}
+
+
+def _is_read(sql):
+    return sql.startswith(('select', 'with')) and not _WRITE_TABLES.search(sql)
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    hash(value)
+    return value
+
+
+def _sizeof(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_sizeof(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    return size
+
+
+def _encode(value):
+    # JSON with tuples, dicts and bytes tagged so _decode restores them
+    # exactly; anything else cannot be snapshotted.
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, tuple):
+        return {'tuple': [_encode(v) for v in value]}
+    if isinstance(value, dict):
+        return {'dict': [[_encode(k), _encode(v)] for k, v in value.items()]}
+    if isinstance(value, bytes):
+        return {'bytes': base64.b64encode(value).decode('ascii')}
+    raise TypeError('cannot snapshot {!r}'.format(type(value)))
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    (kind, items), = value.items()
+    if kind == 'tuple':
+        return tuple(_decode(v) for v in items)
+    if kind == 'dict':
+        return {_decode(k): _decode(v) for k, v in items}
+    if kind == 'bytes':
+        return base64.b64decode(items)
+    raise ValueError('unknown snapshot type {!r}'.format(kind))
+
+
+class _Entry:
+    __slots__ = ('value', 'tables', 'expires', 'size', 'hits', 'refreshing')
+
+    def __init__(self, value, tables, expires, size, hits=0):
+        self.value = value
+        self.tables = tables
+        self.expires = expires
+        self.size = size
+        self.hits = hits
+        self.refreshing = False
+
+
+class QueryCache:
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_table = defaultdict(set)
+        self._generations = defaultdict(int)
+        self._writes = 0
+        self._lock = threading.RLock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.warmed = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return True, entry.value
+
+    def generation(self, tables):
+        # Snapshot taken before running a query; put() refuses the result if
+        # a write invalidated any of its tables while the query was running.
+        with self._lock:
+            if ALL_TABLES in tables:
+                return self._writes
+            return tuple(self._generations[t] for t in sorted(tables)) + (
+                self._generations[ALL_TABLES],)
+
+    def put(self, key, value, tables, ttl=None, generation=None):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation(tables):
+                return
+            hits = 0
+            if key in self._entries:
+                hits = self._entries[key].hits
+                self._remove(key)
+            ttl = self.ttl if ttl is None else ttl
+            self._entries[key] = _Entry(value, frozenset(tables), time.monotonic() + ttl,
+                                        size, hits)
+            self.bytes += size
+            for table in tables:
+                self._by_table[table].add(key)
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self.bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def claim_refresh(self, key, window):
+        # True for exactly one caller once a live entry is within `window`
+        # seconds of expiring; that caller reloads it in the background.
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is None or entry.refreshing
+                    or entry.expires - time.monotonic() > window):
+                return False
+            entry.refreshing = True
+            return True
+
+    def refreshed(self, key, value, tables, ttl=None, generation=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if value is None:
+                # The reload failed; let a later hit try again.
+                if entry is not None:
+                    entry.refreshing = False
+                return
+            self.refreshes += 1
+            self.put(key, value, tables, ttl, generation)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        for table in entry.tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def invalidate_tables(self, tables):
+        with self._lock:
+            self._writes += 1
+            if ALL_TABLES in tables:
+                tables = set(self._by_table) | set(tables)
+            keys = set()
+            for table in tables:
+                self._generations[table] += 1
+                keys.update(self._by_table.get(table, ()))
+            # Entries whose tables could not be worked out depend on anything.
+            keys.update(self._by_table.get(ALL_TABLES, ()))
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def save(self, path, limit=SNAPSHOT_ENTRIES):
+        # Write the `limit` most-hit live entries so a later process can start
+        # warm. Expiry is stored as wall-clock time: whatever was written to
+        # the database while we were down is bounded by the TTL, as usual.
+        now, wall = time.monotonic(), time.time()
+        with self._lock:
+            live = [(key, entry) for key, entry in self._entries.items() if entry.expires > now]
+        live.sort(key=lambda item: item[1].hits, reverse=True)
+        records = []
+        for key, entry in live[:limit]:
+            try:
+                records.append({
+                    'key': _encode(key),
+                    'value': _encode(entry.value),
+                    'tables': sorted(entry.tables),
+                    'expires': wall + entry.expires - now,
+                })
+            except TypeError:
+                continue  # e.g. sqlite3.Row values
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.query-cache-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'entries': records}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return len(records)
+
+    def load(self, path):
+        # A missing or unreadable snapshot just means a cold start, and a
+        # malformed record is skipped without losing the others.
+        try:
+            with open(path) as f:
+                records = json.load(f)['entries']
+        except (OSError, ValueError, TypeError, KeyError):
+            return 0
+        if not isinstance(records, list):
+            return 0
+        loaded = 0
+        wall = time.time()
+        for record in records:
+            try:
+                key = _decode(record['key'])
+                value = _decode(record['value'])
+                tables = set(record['tables'])
+                ttl = float(record['expires']) - wall
+                hash(key)
+            except (ValueError, TypeError, KeyError, AttributeError):
+                continue
+            if ttl > 0:
+                self.put(key, value, tables, ttl)
+                loaded += 1
+        self.warmed += loaded
+        return loaded
+
+    def persist(self, path, limit=SNAPSHOT_ENTRIES):
+        # Opt-in warm start: load `path` now and save back to it at exit.
+        loaded = self.load(path)
+        atexit.register(self.save, path, limit)
+        return loaded
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'coalesced': self.coalesced,
+                'refreshes': self.refreshes,
+                'warmed': self.warmed,
+            }
+
+
+query_cache = QueryCache()
+
+_refresher = None
+_refresh_tasks = set()
+_refresher_lock = threading.Lock()
+
+
+def _refresh_executor():
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = concurrent.futures.ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix='query-cache-refresh')
+        return _refresher
+
+
+@transactional_module.on_commit
+def _invalidate_written_tables(statements):
+    written = set()
+    for statement in statements:
+        written |= tables_written(statement)
+    if written:
+        query_cache.invalidate_tables(written)
+
+
+def _refresh_done(task):
+    # A failed refresh leaves the old entry to expire; the next miss reports
+    # the error to its caller.
+    _refresh_tasks.discard(task)
+    if not task.cancelled():
+        task.exception()
+
+
+# Result of a single flight whose caller was cancelled before it finished.
+_ABANDONED = object()
+
+
+def _copy(value):
+    # Callers get their own list so mutating a result cannot corrupt the cache.
+    return list(value) if isinstance(value, list) else value
+
+
+def cache_query(func=None, *, ttl=None, cache=None, refresh_ahead=None):
+    # Usable as @cache_query or @cache_query(ttl=60). The key is the
+    # normalized SQL plus every other argument (the bound parameters).
+    # With refresh_ahead=N, a hit on an entry that expires within N seconds
+    # reloads it in the background on a pooled connection, so keys that stay
+    # hot never take a synchronous miss.
+    if func is None:
+        return lambda f: cache_query(f, ttl=ttl, cache=cache, refresh_ahead=refresh_ahead)
+    func = profiler.leaf(func)
+    store = cache if cache is not None else query_cache
+    signature = inspect.signature(func)
+
+    def lookup_key(conn, args, kwargs):
+        # (key, sql) for a cacheable read, None for anything else.
+        bound = signature.bind(conn, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = list(bound.arguments.items())[1:]
+        names = [name for name, value in arguments if isinstance(value, str)]
+        if not names:
+            return None
+        query_name = 'query' if 'query' in names else names[0]
+        sql = normalize_sql(bound.arguments[query_name])
+        if not _is_read(sql):
+            return None
+        try:
+            return (sql, _freeze(tuple(item for item in arguments if item[0] != query_name))), sql
+        except TypeError:
+            return None
+
+    def refresh(args, kwargs, key, sql):
+        tables = tables_read(sql)
+        generation = store.generation(tables)
+        value = None
+        try:
+            with connection_module.get_pool().connection() as conn:
+                value = func(conn, *args, **kwargs)
+        finally:
+            store.refreshed(key, value, tables, ttl, generation)
+
+    async def refresh_async(args, kwargs, key, sql):
+        tables = tables_read(sql)
+        generation = store.generation(tables)
+        value = None
+        try:
+            async with connection_module.get_async_pool().connection() as conn:
+                value = await func(conn, *args, **kwargs)
+        finally:
+            store.refreshed(key, value, tables, ttl, generation)
+
+    if inspect.iscoroutinefunction(func):
+        inflight = {}
+
+        @functools.wraps(func)
+        async def async_wrapper(conn, *args, **kwargs):
+            lookup = lookup_key(conn, args, kwargs)
+            if lookup is None:
+                return await func(conn, *args, **kwargs)
+            key, sql = lookup
+            loop = asyncio.get_running_loop()
+            while True:
+                found, value = store.get(key)
+                if found:
+                    if refresh_ahead and store.claim_refresh(key, refresh_ahead):
+                        task = loop.create_task(refresh_async(args, kwargs, key, sql))
+                        _refresh_tasks.add(task)
+                        task.add_done_callback(_refresh_done)
+                    return _copy(value)
+
+                # Single flight: concurrent misses on the same key wait for
+                # the first one's query instead of each running it. If that
+                # caller is cancelled, the waiters look again and one of them
+                # runs the query itself.
+                flight = inflight.get((loop, key))
+                if flight is None:
+                    break
+                store.coalesced += 1
+                value = await asyncio.shield(flight)
+                if value is not _ABANDONED:
+                    return _copy(value)
+
+            flight = inflight[(loop, key)] = loop.create_future()
+            try:
+                tables = tables_read(sql)
+                generation = store.generation(tables)
+                value = await func(conn, *args, **kwargs)
+                store.put(key, value, tables, ttl, generation)
+            except asyncio.CancelledError:
+                flight.set_result(_ABANDONED)
+                raise
+            except BaseException as e:
+                flight.set_exception(e)
+                flight.exception()  # waiters re-raise it; nobody else must log it
+                raise
+            else:
+                flight.set_result(value)
+            finally:
+                del inflight[(loop, key)]
+            return _copy(value)
+        return profiler.layer('cache_query', async_wrapper)
+
+    @functools.wraps(func)
+    def wrapper(conn, *args, **kwargs):
+        lookup = lookup_key(conn, args, kwargs)
+        if lookup is None:
+            return func(conn, *args, **kwargs)
+        key, sql = lookup
+        found, value = store.get(key)
+        if found and refresh_ahead and store.claim_refresh(key, refresh_ahead):
+            _refresh_executor().submit(refresh, args, kwargs, key, sql)
+        if not found:
+            tables = tables_read(sql)
+            generation = store.generation(tables)
+            value = func(conn, *args, **kwargs)
+            store.put(key, value, tables, ttl, generation)
+        return _copy(value)
+    return profiler.layer('cache_query', wrapper)
+
+
+@with_db_connection
+@cache_query
+def fetch_users_with_cache(conn, query):
+    cursor = conn.cursor()
+    cursor.execute(query)
+    return cursor.fetchall()
+
+
+if __name__ == "__main__":
+    # First call will cache the result
+    users = fetch_users_with_cache(query="SELECT * FROM users")
+
+    # Second call will use the cached result
+    users_again = fetch_users_with_cache(query="SELECT * FROM users")
+    print(query_cache.stats())
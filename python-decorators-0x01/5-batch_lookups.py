@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+import inspect
+import functools
+import threading
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import profiler
+
+with_db_connection = __import__('1-with_db_connection').with_db_connection
+
+BATCH_WINDOW = 0.002
+# Stays under SQLite's default limit of 999 bound parameters per statement.
+MAX_BATCH = 500
+
+
+def batch_lookups(window=BATCH_WINDOW, max_batch=MAX_BATCH):
+    # DataLoader-style coalescing. The decorated function takes a list of
+    # keys and returns a dict {key: value}; the decorator turns it into a
+    # function of a single key. Calls made within `window` seconds of each
+    # other (or until max_batch distinct keys are waiting) share one call of
+    # the batch function, i.e. one WHERE id IN (...) query instead of N.
+    # Keys missing from the returned dict resolve to None; if the batch
+    # function raises, every caller in the batch gets the exception.
+    def resolve(batch, results):
+        if not isinstance(results, Mapping):
+            raise TypeError('batch function must return a dict, got {}'.format(
+                type(results).__name__))
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
+    def fail(batch, error):
+        # Nobody in the batch may be left waiting on an unresolved future.
+        for future in batch.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def decorator(func):
+        func = profiler.leaf(func)
+        counts = {'calls': 0, 'batches': 0, 'keys': 0}
+
+        def stats():
+            batches = counts['batches']
+            return dict(counts, keys_per_batch=counts['keys'] / batches if batches else 0.0)
+
+        if inspect.iscoroutinefunction(func):
+            pending = {}  # event loop -> {key: future} collecting keys
+            tasks = set()
+
+            async def run(batch):
+                counts['batches'] += 1
+                counts['keys'] += len(batch)
+                try:
+                    resolve(batch, await func(list(batch)))
+                except BaseException as e:
+                    fail(batch, e)
+                    if not isinstance(e, Exception):
+                        raise
+
+            def dispatch(loop, batch):
+                if pending.get(loop) is batch:
+                    del pending[loop]
+                task = loop.create_task(run(batch))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            def window_closed(loop, batch):
+                # Unless max_batch already sent it on its way.
+                if pending.get(loop) is batch:
+                    dispatch(loop, batch)
+
+            @functools.wraps(func)
+            async def async_wrapper(key):
+                loop = asyncio.get_running_loop()
+                counts['calls'] += 1
+                batch = pending.get(loop)
+                if batch is None:
+                    batch = pending[loop] = {}
+                    loop.call_later(window, window_closed, loop, batch)
+                future = batch.get(key)
+                if future is None:
+                    future = batch[key] = loop.create_future()
+                    if len(batch) >= max_batch:
+                        dispatch(loop, batch)
+                # Shielded so one cancelled caller does not cancel the
+                # result for everyone else waiting on the same key.
+                return await asyncio.shield(future)
+            async_wrapper.stats = stats
+            return profiler.layer('batch_lookups', async_wrapper)
+
+        lock = threading.Lock()
+        state = {'batch': None}
+
+        def run(batch):
+            with lock:
+                counts['batches'] += 1
+                counts['keys'] += len(batch)
+            try:
+                resolve(batch, func(list(batch)))
+            except BaseException as e:
+                fail(batch, e)
+                if not isinstance(e, Exception):
+                    raise
+
+        @functools.wraps(func)
+        def wrapper(key):
+            # The first caller of a batch waits out the window and then runs
+            # the query on its own thread; the others just wait for it.
+            with lock:
+                counts['calls'] += 1
+                batch = state['batch']
+                leader = batch is None
+                if leader:
+                    batch = state['batch'] = {}
+                future = batch.get(key)
+                if future is None:
+                    future = batch[key] = Future()
+                full = len(batch) >= max_batch
+                if full:
+                    state['batch'] = None
+            if full:
+                run(batch)
+            elif leader:
+                try:
+                    time.sleep(window)
+                    with lock:
+                        mine = state['batch'] is batch
+                        if mine:
+                            state['batch'] = None
+                except BaseException as e:
+                    # Interrupted before running the batch: detach it so
+                    # later callers start a new one, and release the
+                    # followers already waiting on it.
+                    with lock:
+                        if state['batch'] is batch:
+                            state['batch'] = None
+                    fail(batch, e)
+                    raise
+                if mine:
+                    run(batch)
+            return future.result()
+        wrapper.stats = stats
+        return profiler.layer('batch_lookups', wrapper)
+    return decorator
+
+
+@batch_lookups()
+@with_db_connection
+def fetch_user_by_id(conn, user_ids):
+    placeholders = ', '.join('?' * len(user_ids))
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users WHERE id IN ({})".format(placeholders), user_ids)
+    return {row[0]: row for row in cursor.fetchall()}
+
+
+if __name__ == "__main__":
+    #### 20 concurrent lookups, one query
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        users = list(executor.map(fetch_user_by_id, range(1, 21)))
+    print(users)
+    print(fetch_user_by_id.stats())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import time
+import inspect
+import functools
+import threading
+import contextvars
+from collections import defaultdict
+
+# Opt-in: while disabled every layer costs one flag check.
+enabled = False
+
+_current = contextvars.ContextVar('profile_frame', default=None)
+_lock = threading.Lock()
+# call path, e.g. ('fetch_user', 'with_db_connection', 'cache_query', 'fetch_user')
+# -> [calls, total seconds, self seconds]
+_stats = defaultdict(lambda: [0, 0.0, 0.0])
+
+
+class _Frame:
+    __slots__ = ('path', 'children')
+
+    def __init__(self, path):
+        self.path = path
+        self.children = 0.0
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def _enter(name, func_name):
+    parent = _current.get()
+    path = (parent.path if parent is not None else (func_name,)) + (name,)
+    frame = _Frame(path)
+    return parent, frame, _current.set(frame), time.perf_counter()
+
+
+def _exit(parent, frame, token, start):
+    elapsed = time.perf_counter() - start
+    _current.reset(token)
+    if parent is not None:
+        parent.children += elapsed
+    # Concurrent children (asyncio.gather inside a layer) can add up to more
+    # than the layer's own wall time; never report negative self time.
+    own = max(0.0, elapsed - frame.children)
+    with _lock:
+        entry = _stats[frame.path]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] += own
+
+
+def _profiled(name, func):
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not enabled:
+                return await func(*args, **kwargs)
+            state = _enter(name, async_wrapper.__name__)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _exit(*state)
+        async_wrapper.__profile_layer__ = name
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+        state = _enter(name, wrapper.__name__)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _exit(*state)
+    wrapper.__profile_layer__ = name
+    return wrapper
+
+
+def leaf(func):
+    # The undecorated function, i.e. the query itself, reported under its own
+    # name at the bottom of the stack. Functions that are already a profiled
+    # layer of another decorator are returned unchanged.
+    if getattr(func, '__profile_layer__', None):
+        return func
+    return _profiled(func.__name__, func)
+
+
+def layer(name, wrapper):
+    return _profiled(name, wrapper)
+
+
+def report():
+    # {function: {'with_db_connection;cache_query;function': {calls, total, self}}}
+    with _lock:
+        items = list(_stats.items())
+    result = defaultdict(dict)
+    for path, (calls, total, own) in items:
+        result[path[0]][';'.join(path[1:])] = {'calls': calls, 'total': total, 'self': own}
+    return dict(result)
+
+
+def dump_collapsed(path):
+    # One "frame;frame;frame <microseconds>" line per call path, the format
+    # flamegraph.pl and speedscope read. Values are self time.
+    with _lock:
+        items = sorted(_stats.items())
+    with open(path, 'w') as f:
+        for stack, (calls, total, own) in items:
+            f.write('{} {}\n'.format(';'.join(stack), int(round(own * 1e6))))
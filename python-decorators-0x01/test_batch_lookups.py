@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+batch_module = __import__('5-batch_lookups')
+batch_lookups = batch_module.batch_lookups
+
+
+class Abort(BaseException):
+    pass
+
+
+def call_concurrently(func, keys):
+    outcomes = {}
+
+    def worker(key):
+        try:
+            outcomes[key] = func(key)
+        except BaseException as e:
+            outcomes[key] = e
+
+    threads = [threading.Thread(target=worker, args=(key,), daemon=True) for key in keys]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return outcomes, [thread for thread in threads if thread.is_alive()]
+
+
+class TestBatchLookups(unittest.TestCase):
+    def test_concurrent_calls_share_one_batch(self):
+        batches = []
+
+        @batch_lookups(window=0.05)
+        def lookup(keys):
+            batches.append(sorted(keys))
+            return {key: key * 10 for key in keys if key != 3}
+
+        outcomes, stuck = call_concurrently(lookup, [1, 2, 3, 4])
+        self.assertEqual(stuck, [])
+        self.assertEqual(outcomes, {1: 10, 2: 20, 3: None, 4: 40})
+        self.assertEqual(batches, [[1, 2, 3, 4]])
+
+    def test_max_batch_splits_batches(self):
+        batches = []
+
+        @batch_lookups(window=0.05, max_batch=2)
+        def lookup(keys):
+            batches.append(len(keys))
+            return {key: key for key in keys}
+
+        outcomes, stuck = call_concurrently(lookup, range(6))
+        self.assertEqual(stuck, [])
+        self.assertEqual(outcomes, {key: key for key in range(6)})
+        self.assertTrue(all(size <= 2 for size in batches))
+
+    def test_non_dict_result_fails_every_caller(self):
+        @batch_lookups(window=0.05)
+        def lookup(keys):
+            return None
+
+        outcomes, stuck = call_concurrently(lookup, [1, 2, 3])
+        self.assertEqual(stuck, [])
+        for outcome in outcomes.values():
+            self.assertIsInstance(outcome, TypeError)
+
+    def test_base_exception_does_not_strand_callers(self):
+        @batch_lookups(window=0.05)
+        def lookup(keys):
+            raise Abort()
+
+        outcomes, stuck = call_concurrently(lookup, [1, 2, 3])
+        self.assertEqual(stuck, [])
+        for outcome in outcomes.values():
+            self.assertIsInstance(outcome, Abort)
+
+    def test_interrupted_leader_does_not_strand_followers(self):
+        @batch_lookups(window=0.05)
+        def lookup(keys):
+            return {key: key for key in keys}
+
+        real_sleep = time.sleep
+        outcomes = {}
+
+        def follower():
+            try:
+                outcomes[2] = lookup(2)
+            except BaseException as e:
+                outcomes[2] = e
+
+        thread = threading.Thread(target=follower, daemon=True)
+
+        def interrupted_sleep(seconds):
+            # A follower joins the leader's batch, then the leader's sleep
+            # is interrupted before it runs the query.
+            thread.start()
+            real_sleep(0.05)
+            raise Abort()
+
+        with patch.object(batch_module.time, 'sleep', side_effect=interrupted_sleep):
+            with self.assertRaises(Abort):
+                lookup(1)
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIsInstance(outcomes[2], Abort)
+        # The abandoned batch is detached; the next caller starts a new one.
+        self.assertEqual(lookup(3), 3)
+
+
+class TestAsyncBatchLookups(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_share_one_batch(self):
+        batches = []
+
+        @batch_lookups()
+        async def lookup(keys):
+            batches.append(sorted(keys))
+            return {key: key * 10 for key in keys}
+
+        results = await asyncio.gather(*[lookup(key) for key in [1, 2, 2, 3]])
+        self.assertEqual(results, [10, 20, 20, 30])
+        self.assertEqual(batches, [[1, 2, 3]])
+
+    async def test_non_dict_result_fails_every_caller(self):
+        @batch_lookups()
+        async def lookup(keys):
+            return [1, 2]
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*[lookup(key) for key in [1, 2]], return_exceptions=True), 5)
+        for result in results:
+            self.assertIsInstance(result, TypeError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import tempfile
+import unittest
+
+cache_module = __import__('4-cache_query')
+transactional = __import__('2-transactional').transactional
+QueryCache = cache_module.QueryCache
+ALL_TABLES = cache_module.ALL_TABLES
+
+
+class TestTables(unittest.TestCase):
+    def test_read_tables(self):
+        cases = [
+            ('SELECT * FROM users WHERE id = ?', {'users'}),
+            ('SELECT * FROM users u JOIN orders o ON u.id = o.user_id', {'users', 'orders'}),
+            ('SELECT * FROM users u, orders o WHERE u.id = o.user_id', {'users', 'orders'}),
+            ('select * from users as u , orders, "main".items i', {'users', 'orders', 'items'}),
+            ('SELECT * FROM users WHERE id IN (SELECT user_id FROM orders)', {'users', 'orders'}),
+            ('SELECT * FROM (SELECT * FROM users) u, orders', {ALL_TABLES}),
+            ('SELECT 1', {ALL_TABLES}),
+        ]
+        for sql, tables in cases:
+            self.assertEqual(cache_module.tables_read(sql), tables, sql)
+
+    def test_written_tables(self):
+        self.assertEqual(cache_module.tables_written('INSERT OR REPLACE INTO users VALUES (1)'),
+                         {'users'})
+        self.assertEqual(cache_module.tables_written('UPDATE "users" SET age = 1'), {'users'})
+        self.assertEqual(cache_module.tables_written('DROP TABLE users'), {ALL_TABLES})
+        self.assertEqual(cache_module.tables_written('SELECT * FROM users'), set())
+
+
+class TestQueryCache(unittest.TestCase):
+    def test_ttl_expiry(self):
+        cache = QueryCache(ttl=0.01)
+        cache.put('q', [1], {'users'})
+        self.assertEqual(cache.get('q'), (True, [1]))
+        time.sleep(0.02)
+        self.assertEqual(cache.get('q'), (False, None))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_entry_cap_evicts_least_recently_used(self):
+        cache = QueryCache(max_entries=2)
+        cache.put('a', [1], {'users'})
+        cache.put('b', [2], {'users'})
+        cache.get('a')
+        cache.put('c', [3], {'users'})
+        self.assertTrue(cache.get('a')[0])
+        self.assertFalse(cache.get('b')[0])
+        self.assertTrue(cache.get('c')[0])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_byte_cap(self):
+        value = ['x' * 1000]
+        size = cache_module._sizeof(value)
+        cache = QueryCache(max_bytes=size * 2 + size // 2)
+        for key in 'abc':
+            cache.put(key, list(value), {'users'})
+        self.assertFalse(cache.get('a')[0])
+        self.assertLessEqual(cache.stats()['bytes'], cache.max_bytes)
+        cache.put('huge', ['x' * 10000], {'users'})
+        self.assertFalse(cache.get('huge')[0])
+
+    def test_invalidation_by_table(self):
+        cache = QueryCache()
+        cache.put('users', [1], {'users'})
+        cache.put('orders', [2], {'orders'})
+        cache.put('unknown', [3], {ALL_TABLES})
+        cache.invalidate_tables({'users'})
+        self.assertFalse(cache.get('users')[0])
+        self.assertTrue(cache.get('orders')[0])
+        self.assertFalse(cache.get('unknown')[0])
+
+    def test_read_racing_a_write_is_not_cached(self):
+        cache = QueryCache()
+        generation = cache.generation({'users'})
+        cache.invalidate_tables({'users'})  # committed while the read ran
+        cache.put('q', [1], {'users'}, generation=generation)
+        self.assertFalse(cache.get('q')[0])
+        cache.put('q', [1], {'users'}, generation=cache.generation({'users'}))
+        self.assertTrue(cache.get('q')[0])
+
+    def test_unrelated_write_does_not_drop_read(self):
+        cache = QueryCache()
+        generation = cache.generation({'users'})
+        cache.invalidate_tables({'orders'})
+        cache.put('q', [1], {'users'}, generation=generation)
+        self.assertTrue(cache.get('q')[0])
+
+
+class TestCacheInvalidationOnCommit(unittest.TestCase):
+    def setUp(self):
+        cache_module.query_cache.clear()
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.executescript('''
+            CREATE TABLE users (id INTEGER PRIMARY KEY);
+            CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER);
+            INSERT INTO users VALUES (1);
+            INSERT INTO orders VALUES (1, 1);
+        ''')
+
+    def tearDown(self):
+        self.conn.close()
+        cache_module.query_cache.clear()
+
+    def test_write_through_transactional_evicts_comma_join(self):
+        @cache_module.cache_query
+        def fetch(conn, query):
+            return conn.execute(query).fetchall()
+
+        @transactional
+        def add_order(conn, order_id):
+            conn.execute('INSERT INTO orders VALUES (?, 1)', (order_id,))
+
+        query = 'SELECT o.id FROM users u, orders o WHERE u.id = o.user_id ORDER BY o.id'
+        self.assertEqual(fetch(self.conn, query), [(1,)])
+        self.assertEqual(fetch(self.conn, query), [(1,)])
+        add_order(self.conn, 2)
+        self.assertEqual(fetch(self.conn, query), [(1,), (2,)])
+
+    def test_rolled_back_write_keeps_entry(self):
+        @cache_module.cache_query
+        def fetch(conn, query):
+            return conn.execute(query).fetchall()
+
+        @transactional
+        def failing(conn):
+            conn.execute('INSERT INTO orders VALUES (3, 1)')
+            raise ValueError
+
+        query = 'SELECT id FROM orders'
+        fetch(self.conn, query)
+        with self.assertRaises(ValueError):
+            failing(self.conn)
+        self.assertTrue(cache_module.query_cache.get(
+            (cache_module.normalize_sql(query), ()))[0])
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip_keeps_types(self):
+        cache = QueryCache()
+        key = ('select * from users where id = ?', (('params', (1,)),))
+        value = [(1, 'Alice', b'\x00\x01', None, 2.5), {'id': 1}]
+        cache.put(key, value, {'users'})
+        self.assertEqual(cache.save(self.path), 1)
+
+        warm = QueryCache()
+        self.assertEqual(warm.load(self.path), 1)
+        self.assertEqual(warm.get(key), (True, value))
+
+    def test_hottest_entries_are_kept(self):
+        cache = QueryCache()
+        for i in range(3):
+            cache.put(('q', i), [i], {'users'})
+        for _ in range(5):
+            cache.get(('q', 2))
+        cache.get(('q', 0))
+        cache.save(self.path, limit=2)
+
+        warm = QueryCache()
+        warm.load(self.path)
+        self.assertTrue(warm.get(('q', 2))[0])
+        self.assertTrue(warm.get(('q', 0))[0])
+        self.assertFalse(warm.get(('q', 1))[0])
+
+    def test_unsupported_values_are_skipped(self):
+        cache = QueryCache()
+        cache.put(('q', 1), [object()], {'users'})
+        cache.put(('q', 2), [2], {'users'})
+        self.assertEqual(cache.save(self.path), 1)
+
+    def test_missing_or_garbage_file_is_a_cold_start(self):
+        cache = QueryCache()
+        self.assertEqual(cache.load(self.path), 0)
+        with open(self.path, 'wb') as f:
+            f.write(b'\x80garbage')
+        self.assertEqual(cache.load(self.path), 0)
+
+    def test_bad_records_are_skipped(self):
+        good = {'key': 'q', 'value': [1], 'tables': ['users'], 'expires': 4102444800}
+        records = [
+            {'key': {'pickle': 'x'}, 'value': [1], 'tables': ['users'], 'expires': 4102444800},
+            {'key': ['unhashable'], 'value': [1], 'tables': ['users'], 'expires': 4102444800},
+            {'value': [1]},
+            'garbage',
+            good,
+        ]
+        with open(self.path, 'w') as f:
+            json.dump({'entries': records}, f)
+        cache = QueryCache()
+        self.assertEqual(cache.load(self.path), 1)
+        self.assertEqual(cache.get('q'), (True, [1]))
+
+    def test_expired_records_are_not_loaded(self):
+        with open(self.path, 'w') as f:
+            json.dump({'entries': [{'key': 'q', 'value': [1], 'tables': ['users'],
+                                    'expires': 1}]}, f)
+        self.assertEqual(QueryCache().load(self.path), 0)
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.calls = 0
+
+    def cached(self, delay=0.05, error=None):
+        @cache_module.cache_query(cache=QueryCache())
+        async def fetch(conn, query):
+            self.calls += 1
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            return [self.calls]
+        return fetch
+
+    async def test_concurrent_misses_run_one_query(self):
+        fetch = self.cached()
+        results = await asyncio.gather(*[fetch(None, 'SELECT 1') for _ in range(5)])
+        self.assertEqual(results, [[1]] * 5)
+        self.assertEqual(self.calls, 1)
+
+    async def test_error_reaches_every_waiter(self):
+        fetch = self.cached(error=ValueError('boom'))
+        results = await asyncio.gather(*[fetch(None, 'SELECT 1') for _ in range(3)],
+                                       return_exceptions=True)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+        self.assertEqual(self.calls, 1)
+
+    async def test_cancelled_leader_does_not_cancel_waiters(self):
+        fetch = self.cached(delay=0.1)
+        leader = asyncio.ensure_future(asyncio.wait_for(fetch(None, 'SELECT 1'), 0.05))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(fetch(None, 'SELECT 1'))
+        with self.assertRaises(asyncio.TimeoutError):
+            await leader
+        # The waiter took over and ran the query itself.
+        self.assertEqual(await waiter, [2])
+
+    async def test_cancelled_waiter_does_not_cancel_leader(self):
+        fetch = self.cached()
+        leader = asyncio.ensure_future(fetch(None, 'SELECT 1'))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(fetch(None, 'SELECT 1'))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        self.assertEqual(await leader, [1])
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+
+
+if __name__ == '__main__':
+    unittest.main()
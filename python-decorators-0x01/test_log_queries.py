@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import unittest
+
+log_module = __import__('0-log_queries')
+QueryLog = log_module.QueryLog
+LatencyHistogram = log_module.LatencyHistogram
+fingerprint = log_module.fingerprint
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_literals_are_replaced(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM users WHERE id = 42 AND name = 'O''Brien';"),
+            'select * from users where id = ? and name = ?')
+
+    def test_in_lists_collapse(self):
+        self.assertEqual(fingerprint('SELECT * FROM users WHERE id IN (?, ?, ?)'),
+                         fingerprint('SELECT * FROM users WHERE id IN (?,?)'))
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentiles_within_bucket_error(self):
+        histogram = LatencyHistogram()
+        for i in range(1, 101):
+            histogram.record(i / 1000.0, rows=1)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['rows'], 100)
+        self.assertAlmostEqual(summary['p50'], 0.050, delta=0.006)
+        self.assertAlmostEqual(summary['p99'], 0.099, delta=0.011)
+        self.assertEqual(summary['max'], 0.1)
+
+    def test_empty(self):
+        self.assertEqual(LatencyHistogram().percentile(50), 0.0)
+
+
+class TestQueryLog(unittest.TestCase):
+    def test_records_are_grouped_by_fingerprint(self):
+        log = QueryLog(flush_interval=60)
+        log.record('SELECT * FROM users WHERE id = 1', 0.001, 1)
+        log.record('SELECT * FROM users WHERE id = 2', 0.003, 1)
+        stats = log.stats()
+        self.assertEqual(list(stats), ['select * from users where id = ?'])
+        self.assertEqual(stats['select * from users where id = ?']['count'], 2)
+
+    def test_ring_buffer_drops_oldest(self):
+        log = QueryLog(capacity=3, flush_interval=60)
+        for i in range(5):
+            log._buffer.append((0, 'SELECT {}'.format(i), 0.001, None))
+        self.assertEqual([record[1] for record in log._buffer], ['SELECT 2', 'SELECT 3', 'SELECT 4'])
+
+    def test_sampling(self):
+        log = QueryLog(sample_rate=0.0, flush_interval=60)
+        log.record('SELECT 1', 0.001)
+        self.assertEqual(log.stats(), {})
+
+    def test_slow_queries_are_logged(self):
+        log = QueryLog(flush_interval=60, slow_query_seconds=0.5)
+        with self.assertLogs('query_log', level='WARNING') as logs:
+            log.record('SELECT 1', 0.6)
+            log.flush()
+        self.assertIn('slow query', logs.output[0])
+
+    def test_decorator_records_rows(self):
+        log_module.query_log.reset()
+
+        @log_module.log_queries
+        def fetch(query):
+            return [(1,), (2,)]
+
+        fetch(query='SELECT id FROM users')
+        stats = log_module.query_log.stats()['select id from users']
+        self.assertEqual((stats['count'], stats['rows']), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+
+import profiler
+log_queries = __import__('0-log_queries').log_queries
+retry_on_failure = __import__('3-retry_on_failure').retry_on_failure
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        profiler.reset()
+        profiler.enable()
+
+    def tearDown(self):
+        profiler.disable()
+        profiler.reset()
+
+    def test_layers_report_call_paths(self):
+        @log_queries
+        @retry_on_failure(breaker=None, budget=None)
+        def fetch(query):
+            time.sleep(0.01)
+            return []
+
+        for _ in range(3):
+            fetch('SELECT 1')
+        report = profiler.report()['fetch']
+        self.assertEqual(set(report), {'log_queries', 'log_queries;retry_on_failure',
+                                       'log_queries;retry_on_failure;fetch'})
+        leaf = report['log_queries;retry_on_failure;fetch']
+        self.assertEqual(leaf['calls'], 3)
+        self.assertGreaterEqual(leaf['self'], 0.03)
+        outer = report['log_queries']
+        self.assertGreaterEqual(outer['total'], leaf['total'])
+        self.assertLess(outer['self'], leaf['self'])
+
+    def test_async_tasks_keep_separate_stacks(self):
+        @retry_on_failure(breaker=None, budget=None)
+        async def fetch(query):
+            await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(*[fetch('SELECT 1') for _ in range(5)])
+
+        asyncio.run(main())
+        report = profiler.report()['fetch']
+        self.assertEqual(set(report), {'retry_on_failure', 'retry_on_failure;fetch'})
+        self.assertEqual(report['retry_on_failure;fetch']['calls'], 5)
+
+    def test_disabled_records_nothing(self):
+        profiler.disable()
+
+        @log_queries
+        def fetch(query):
+            return []
+
+        fetch('SELECT 1')
+        self.assertEqual(profiler.report(), {})
+
+    def test_dump_collapsed(self):
+        @log_queries
+        def fetch(query):
+            return []
+
+        fetch('SELECT 1')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stacks.txt')
+            profiler.dump_collapsed(path)
+            with open(path) as f:
+                lines = f.read().splitlines()
+        self.assertEqual([line.rsplit(' ', 1)[0] for line in lines],
+                         ['fetch;log_queries', 'fetch;log_queries;fetch'])
+        for line in lines:
+            int(line.rsplit(' ', 1)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
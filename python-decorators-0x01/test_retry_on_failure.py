@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import time
+import asyncio
+import sqlite3
+import unittest
+
+retry_module = __import__('3-retry_on_failure')
+CircuitBreaker = retry_module.CircuitBreaker
+CircuitOpenError = retry_module.CircuitOpenError
+RetryBudget = retry_module.RetryBudget
+retry_on_failure = retry_module.retry_on_failure
+
+
+class Abort(BaseException):
+    pass
+
+
+def locked():
+    return sqlite3.OperationalError('database is locked')
+
+
+class TestRetryOnFailure(unittest.TestCase):
+    def test_transient_errors_are_retried(self):
+        outcomes = [locked(), locked(), 'ok']
+
+        @retry_on_failure(retries=3, delay=0.001, breaker=None, budget=None)
+        def query():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(query(), 'ok')
+        self.assertEqual(outcomes, [])
+
+    def test_other_errors_are_not_retried(self):
+        calls = []
+
+        @retry_on_failure(retries=3, delay=0.001, breaker=None, budget=None)
+        def query():
+            calls.append(1)
+            raise sqlite3.OperationalError('no such table: users')
+
+        with self.assertRaises(sqlite3.OperationalError):
+            query()
+        self.assertEqual(len(calls), 1)
+
+    def test_budget_limits_retries(self):
+        calls = []
+        budget = RetryBudget(ratio=0, initial=1)
+
+        @retry_on_failure(retries=5, delay=0.001, breaker=None, budget=budget)
+        def query():
+            calls.append(1)
+            raise locked()
+
+        with self.assertRaises(sqlite3.OperationalError):
+            query()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(budget.exhausted, 1)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_rate=0.5, min_calls=2, reset_timeout=0.01)
+
+    def open_circuit(self):
+        @retry_on_failure(retries=0, breaker=self.breaker, budget=None)
+        def failing():
+            raise locked()
+
+        for _ in range(2):
+            with self.assertRaises(sqlite3.OperationalError):
+                failing()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_open_circuit_fails_fast(self):
+        self.open_circuit()
+
+        @retry_on_failure(breaker=self.breaker, budget=None)
+        def query():
+            return 'ok'
+
+        with self.assertRaises(CircuitOpenError):
+            query()
+        time.sleep(0.02)
+        self.assertEqual(query(), 'ok')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_probe_raises_the_original_error(self):
+        self.open_circuit()
+        time.sleep(0.02)
+        budget = RetryBudget(ratio=0, initial=1)
+        calls = []
+
+        @retry_on_failure(retries=3, delay=0.001, breaker=self.breaker, budget=budget)
+        def probe():
+            calls.append(1)
+            raise locked()
+
+        with self.assertRaises(sqlite3.OperationalError) as raised:
+            probe()
+        self.assertNotIsInstance(raised.exception, CircuitOpenError)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(budget.exhausted, 0)
+        self.assertTrue(budget.withdraw())
+
+    def test_single_probe_while_half_open(self):
+        self.open_circuit()
+        time.sleep(0.02)
+        self.assertEqual(self.breaker.allow(), CircuitBreaker.TRIAL)
+        self.assertFalse(self.breaker.allow())
+
+    def test_interrupted_probe_does_not_wedge_the_circuit(self):
+        self.open_circuit()
+        time.sleep(0.02)
+
+        @retry_on_failure(breaker=self.breaker, budget=None)
+        def interrupted():
+            raise Abort()
+
+        with self.assertRaises(Abort):
+            interrupted()
+        self.assertEqual(self.breaker.allow(), CircuitBreaker.TRIAL)
+
+
+class TestAsyncCircuitBreaker(unittest.IsolatedAsyncioTestCase):
+    async def test_cancelled_probe_does_not_wedge_the_circuit(self):
+        breaker = CircuitBreaker(failure_rate=0.5, min_calls=2, reset_timeout=0.01)
+        for _ in range(2):
+            breaker.record(False)
+        await asyncio.sleep(0.02)
+
+        @retry_on_failure(breaker=breaker, budget=None)
+        async def slow():
+            await asyncio.sleep(1)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(slow(), 0.01)
+        self.assertEqual(breaker.allow(), CircuitBreaker.TRIAL)
+
+
+if __name__ == '__main__':
+    unittest.main()
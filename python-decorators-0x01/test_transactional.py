@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+connection_module = __import__('1-with_db_connection')
+transactional_module = __import__('2-transactional')
+GroupCommit = transactional_module.GroupCommit
+
+
+class TestGroupCommit(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, 'test.db')
+        conn = sqlite3.connect(self.database)
+        conn.executescript('''
+            CREATE TABLE parents (id INTEGER PRIMARY KEY);
+            CREATE TABLE children (
+                id INTEGER PRIMARY KEY,
+                parent_id INTEGER REFERENCES parents(id) DEFERRABLE INITIALLY DEFERRED
+            );
+            INSERT INTO parents VALUES (1);
+        ''')
+        conn.close()
+        pragmas = dict(connection_module.PRAGMAS, foreign_keys='ON')
+        with patch.object(connection_module, 'PRAGMAS', pragmas):
+            # max_batch=3 so three writers always share one batch, committed
+            # inline by the third; the flusher never gets there first.
+            self.group = GroupCommit(self.database, max_batch=3, max_latency=60, wait=True)
+
+    def tearDown(self):
+        self.group.close()
+        self.directory.cleanup()
+
+    def write_concurrently(self, parent_ids):
+        @self.group
+        def add_child(conn, child_id, parent_id):
+            conn.execute('INSERT INTO children VALUES (?, ?)', (child_id, parent_id))
+
+        outcomes = {}
+
+        def worker(child_id, parent_id):
+            try:
+                add_child(child_id, parent_id)
+                outcomes[child_id] = 'ok'
+            except sqlite3.Error as e:
+                outcomes[child_id] = e
+
+        threads = [threading.Thread(target=worker, args=(i, parent_id))
+                   for i, parent_id in enumerate(parent_ids)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return outcomes
+
+    def count_children(self):
+        conn = sqlite3.connect(self.database)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM children').fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_committed_batch_succeeds_for_every_caller(self):
+        outcomes = self.write_concurrently([1, 1, 1])
+        self.assertEqual(outcomes, {0: 'ok', 1: 'ok', 2: 'ok'})
+        self.assertEqual(self.count_children(), 3)
+        self.assertEqual(self.group.stats()['commits'], 1)
+
+    def test_failed_commit_is_raised_to_every_caller(self):
+        # The deferred foreign key only fails at COMMIT, after every
+        # savepoint in the batch has been released.
+        outcomes = self.write_concurrently([1, 1, 2])
+        self.assertEqual(len(outcomes), 3)
+        for outcome in outcomes.values():
+            self.assertIsInstance(outcome, sqlite3.IntegrityError)
+        self.assertEqual(self.count_children(), 0)
+        self.assertEqual(self.group._failed, {})
+
+    def test_failing_hook_does_not_stop_the_flusher(self):
+        self.group.close()
+        self.group = GroupCommit(self.database, max_batch=100, max_latency=0.01, wait=True)
+
+        def failing_hook(statements):
+            raise RuntimeError('hook failed')
+
+        @self.group
+        def add_child(conn, child_id):
+            conn.execute('INSERT INTO children VALUES (?, 1)', (child_id,))
+
+        # Both batches are committed by the flusher thread; the second one
+        # would block forever if the first hook's error had killed it.
+        with patch.object(transactional_module, 'commit_hooks', [failing_hook]), \
+                self.assertLogs('group_commit', 'ERROR'):
+            add_child(1)
+            add_child(2)
+        self.assertEqual(self.count_children(), 2)
+        self.assertEqual(self.group.stats()['commits'], 2)
+        self.assertTrue(self.group._flusher.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
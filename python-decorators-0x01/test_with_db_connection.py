@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import os
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import AsyncMock, Mock
+
+connection_module = __import__('1-with_db_connection')
+ConnectionPool = connection_module.ConnectionPool
+PoolTimeout = connection_module.PoolTimeout
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, 'test.db')
+        conn = sqlite3.connect(self.database)
+        conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.close()
+        self.pool = ConnectionPool(self.database, size=1, timeout=5)
+
+    def tearDown(self):
+        self.pool.close()
+        self.directory.cleanup()
+
+    def test_connection_is_reused_with_pragmas(self):
+        with self.pool.connection() as conn:
+            first = conn
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+        with self.pool.connection() as conn:
+            self.assertIs(conn, first)
+        self.assertEqual(self.pool.stats()['open'], 1)
+
+    def test_open_transaction_is_rolled_back_on_release(self):
+        with self.pool.connection() as conn:
+            conn.execute("INSERT INTO users (name) VALUES ('a')")
+        with self.pool.connection() as conn:
+            self.assertFalse(conn.in_transaction)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM users').fetchone(), (0,))
+
+    def test_times_out_when_exhausted(self):
+        self.pool.timeout = 0.05
+        conn = self.pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire()
+        self.pool.release(conn)
+
+    def test_waiter_gets_released_connection(self):
+        conn = self.pool.acquire()
+        threading.Timer(0.05, self.pool.release, (conn,)).start()
+        self.assertIs(self.pool.acquire(), conn)
+        self.assertEqual(self.pool.stats()['waits'], 1)
+        self.pool.release(conn)
+
+    def test_discarded_connection_wakes_waiter(self):
+        conn = self.pool.acquire()
+        broken = Mock(in_transaction=True)
+        broken.rollback.side_effect = sqlite3.OperationalError('disk I/O error')
+        # The slot frees up without a connection coming back; the waiter
+        # must open a new one instead of timing out.
+        threading.Timer(0.05, self.pool.release, (broken,)).start()
+        fresh = self.pool.acquire()
+        self.assertIsNot(fresh, conn)
+        broken.close.assert_called_once_with()
+        self.assertEqual(self.pool.stats()['open'], 1)
+        self.pool.release(fresh)
+        conn.close()
+
+
+class TestWithDbConnection(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        database = os.path.join(self.directory.name, 'test.db')
+        self.pool = connection_module.configure_pool(database=database, size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        connection_module._pool = None
+        self.directory.cleanup()
+
+    def test_passes_a_pooled_connection(self):
+        @connection_module.with_db_connection
+        def query(conn, value):
+            return conn, conn.execute('SELECT ?', (value,)).fetchone()
+
+        conn, row = query(7)
+        self.assertEqual(row, (7,))
+        self.assertIs(query(8)[0], conn)
+        self.assertEqual(self.pool.stats()['idle'], 1)
+
+
+@unittest.skipIf(connection_module.aiosqlite is None, 'aiosqlite is not installed')
+class TestAsyncConnectionPool(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        database = os.path.join(self.directory.name, 'test.db')
+        self.pool = connection_module.AsyncConnectionPool(database, size=1, timeout=5)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+        self.directory.cleanup()
+
+    async def test_connection_is_reused(self):
+        async with self.pool.connection() as conn:
+            first = conn
+        async with self.pool.connection() as conn:
+            self.assertIs(conn, first)
+
+    async def test_times_out_when_exhausted(self):
+        self.pool.timeout = 0.05
+        conn = await self.pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            await self.pool.acquire()
+        await self.pool.release(conn)
+
+    async def test_discarded_connection_wakes_waiter(self):
+        conn = await self.pool.acquire()
+        waiter = asyncio.ensure_future(self.pool.acquire())
+        await asyncio.sleep(0.01)
+        broken = Mock(in_transaction=True)
+        broken.rollback = AsyncMock(side_effect=sqlite3.OperationalError('disk I/O error'))
+        broken.close = AsyncMock()
+        await self.pool.release(broken)
+        fresh = await asyncio.wait_for(waiter, 5)
+        self.assertIsNot(fresh, conn)
+        self.assertEqual(self.pool.stats()['open'], 1)
+        await self.pool.release(fresh)
+        await conn.close()
+
+
+
+@unittest.skipIf(connection_module.aiosqlite is None, 'aiosqlite is not installed')
+class TestAsyncPoolShutdown(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, 'test.db')
+        self.addCleanup(setattr, connection_module, '_async_pool', connection_module._async_pool)
+        settings = dict(connection_module._async_settings)
+        self.addCleanup(connection_module._async_settings.update, settings)
+        self.addCleanup(connection_module._async_settings.clear)
+        self.addCleanup(self.directory.cleanup)
+
+    def test_pool_is_closed_when_the_loop_shuts_down(self):
+        @connection_module.with_db_connection
+        async def query(conn, value):
+            async with conn.execute('SELECT ?', (value,)) as cursor:
+                return (await cursor.fetchone())[0]
+
+        async def main():
+            await connection_module.configure_async_pool(database=self.database, size=2)
+            values = await asyncio.gather(query(1), query(2))
+            return values, connection_module.get_async_pool()
+
+        threads = set(threading.enumerate())
+        values, pool = asyncio.run(main())
+        self.assertEqual(values, [1, 2])
+        self.assertEqual(pool.stats()['open'], 0)
+        # The connections' worker threads are gone, so nothing blocks exit.
+        for thread in set(threading.enumerate()) - threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
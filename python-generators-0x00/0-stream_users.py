@@ -6,19 +6,24 @@ from seed import connect_to_prodev
 def stream_users():
     query = "SELECT * FROM user_data"
     connection = connect_to_prodev()
-    
+
     try:
-        with connection.cursor(dictionary=True) as cursor:
-            cursor.execute(query)
-            result = cursor.fetchall()
-            for row in result:
-                yield row
+        # Unbuffered cursor: rows are read off the socket as the consumer
+        # asks for them instead of fetchall() pulling the whole table into
+        # memory before the first row can be yielded.
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        cursor.execute(query)
+        for row in cursor:
+            yield row
     except Error as e:
         print(e)
     finally:
+        # Closing the cursor of an unbuffered result that was not read to the
+        # end (consumer stopped early) raises "Unread result found", so only
+        # the connection is closed; that drops the pending result with it.
         connection.close()
 
 
 if __name__ == "__main__":
-    stream_users()
-
+    for user in stream_users():
+        print(user)
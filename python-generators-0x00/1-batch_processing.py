@@ -1,15 +1,91 @@
 #!/usr/bin/env python3
 
+import queue
+import threading
+
+from mysql.connector import Error
 from seed import connect_to_prodev
 
+_DONE = object()
+
+
+def stream_users_in_batches(batch_size, prefetch=False):
+    # With prefetch, database errors are raised to the consumer rather than
+    # printed, so a failed read cannot pass for the end of the table.
+    if prefetch:
+        yield from _prefetched_batches(batch_size)
+        return
+    try:
+        yield from _fetch_batches(batch_size)
+    except Error as e:
+        print(e)
+
+
+def _fetch_batches(batch_size):
+    query = "SELECT * FROM user_data"
+    connection = connect_to_prodev()
+    try:
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        cursor.execute(query)
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        connection.close()
+
+
+def _prefetched_batches(batch_size):
+    # A background thread keeps one batch in flight: while the consumer is
+    # working on batch N, batch N+1 is already being read from MySQL. The
+    # connection is only ever touched by that thread.
+    batches = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        source = _fetch_batches(batch_size)
+        try:
+            for batch in source:
+                if not put(batch):
+                    return
+        except BaseException as e:
+            put(e)
+            return
+        finally:
+            source.close()
+        put(_DONE)
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        worker.join()
+
 
-def stream_users_in_batches(batch_size):
-    pass
-    
+def batch_processing(batch_size, prefetch=False):
+    for batch in stream_users_in_batches(batch_size, prefetch=prefetch):
+        for user in batch:
+            if user["age"] > 25:
+                print(user)
 
-def batch_processing(batch_size):
-    pass
 
-# ["FROM user_data", "SELECT"]
-# ["25", ">"]
-# ["yield", "return"]
+if __name__ == "__main__":
+    batch_processing(50, prefetch=True)
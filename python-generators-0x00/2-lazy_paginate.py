@@ -1,10 +1,100 @@
 #!/usr/bin/env python3
 
+import base64
+import json
+
+from mysql.connector import Error
 from seed import connect_to_prodev
 
-def lazy_paginate(page_size):
-    pass
 
-# SELECT FROM LIMIT WHERE
-# ["def paginate_users", "SELECT * FROM user_data LIMIT", "OFFSET"]
-# ["paginate_users(page_size, offset)"]
+class Page(list):
+    # A page of users plus the opaque token that resumes right after it.
+    def __init__(self, rows, next_token=None):
+        super().__init__(rows)
+        self.next_token = next_token
+
+
+def encode_token(state):
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_token(token):
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("invalid page token: {!r}".format(token))
+    if (not isinstance(state, dict)
+            or state.get("mode") not in ("keyset", "offset")
+            or "after" not in state
+            or not isinstance(state["after"], (str, type(None)))
+            or type(state.get("offset")) is not int or state["offset"] < 0):
+        raise ValueError("invalid page token: {!r}".format(token))
+    return state
+
+
+def paginate_users(page_size, offset, connection=None):
+    # OFFSET paging: the server still walks past `offset` rows, so every
+    # page costs more than the one before it. Kept for comparison.
+    query = "SELECT * FROM user_data ORDER BY user_id LIMIT %s OFFSET %s"
+    return _fetch_page(query, (page_size, offset), connection)
+
+
+def paginate_users_after(page_size, last_user_id=None, connection=None):
+    # Keyset (seek) paging: an index range scan on the primary key starting
+    # right after the last row seen, so page N is as cheap as page 1.
+    if last_user_id is None:
+        query = "SELECT * FROM user_data ORDER BY user_id LIMIT %s"
+        params = (page_size,)
+    else:
+        query = ("SELECT * FROM user_data WHERE user_id > %s "
+                 "ORDER BY user_id LIMIT %s")
+        params = (last_user_id, page_size)
+    return _fetch_page(query, params, connection)
+
+
+def _fetch_page(query, params, connection=None):
+    owns_connection = connection is None
+    if owns_connection:
+        connection = connect_to_prodev()
+    try:
+        with connection.cursor(dictionary=True) as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+    finally:
+        if owns_connection:
+            connection.close()
+
+
+def lazy_paginate(page_size, token=None, mode="keyset"):
+    if token is not None:
+        state = decode_token(token)
+    elif mode in ("keyset", "offset"):
+        state = {"mode": mode, "after": None, "offset": 0}
+    else:
+        raise ValueError("mode must be 'keyset' or 'offset'")
+
+    connection = connect_to_prodev()
+    try:
+        while True:
+            if state["mode"] == "keyset":
+                rows = paginate_users_after(page_size, state["after"], connection)
+            else:
+                rows = paginate_users(page_size, state["offset"], connection)
+            if not rows:
+                return
+            state = dict(state, after=rows[-1]["user_id"],
+                         offset=state["offset"] + len(rows))
+            yield Page(rows, encode_token(state))
+            if len(rows) < page_size:
+                return
+    except Error as e:
+        print(e)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    for page in lazy_paginate(100):
+        for user in page:
+            print(user)
@@ -1,10 +1,69 @@
 #!/usr/bin/env python3
 
+import sys
+import time
+
 from seed import connect_to_prodev
 
-def stream_user_ages():
-    pass
 
-# ["def paginate_users", "SELECT * FROM user_data LIMIT", "OFFSET"]
-# ["yield", "return"]
-# ["FROM user_data", "SELECT", "+"]
+def stream_user_ages(batch_size=1000):
+    # Only the age column is selected and rows come back as plain tuples,
+    # so no per-row dict is ever built.
+    connection = connect_to_prodev()
+    try:
+        cursor = connection.cursor(buffered=False)
+        cursor.execute("SELECT age FROM user_data")
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                return
+            for (age,) in batch:
+                yield age
+    finally:
+        connection.close()
+
+
+def _stats(total, count):
+    average = float(total) / count if count else 0.0
+    return {"count": count, "sum": total, "average": average}
+
+
+def average_age(pushdown=False, batch_size=1000):
+    if pushdown:
+        # Let MySQL aggregate; only one row crosses the wire. The average is
+        # derived from SUM/COUNT the same way as the streaming path so both
+        # modes report identical numbers (AVG() rounds DECIMAL results).
+        connection = connect_to_prodev()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*), COALESCE(SUM(age), 0) FROM user_data")
+                count, total = cursor.fetchone()
+        finally:
+            connection.close()
+        return _stats(total, count)
+
+    total = 0
+    count = 0
+    for age in stream_user_ages(batch_size):
+        total += age
+        count += 1
+    return _stats(total, count)
+
+
+def compare(batch_size=1000):
+    results = {}
+    for pushdown in (False, True):
+        start = time.perf_counter()
+        stats = average_age(pushdown=pushdown, batch_size=batch_size)
+        stats["seconds"] = time.perf_counter() - start
+        results["pushdown" if pushdown else "streaming"] = stats
+    return results
+
+
+if __name__ == "__main__":
+    if "--compare" in sys.argv:
+        for mode, stats in compare().items():
+            print("{}: average {:.4f} over {} users in {:.3f}s".format(
+                mode, stats["average"], stats["count"], stats["seconds"]))
+    else:
+        print("Average age of users: {:.2f}".format(average_age()["average"]))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+from array import array
+
+from seed import connect_to_prodev
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; fall back to compact stdlib arrays
+    np = None
+
+COLUMNS = ("user_id", "name", "email", "age")
+NUMERIC_COLUMNS = ("age",)
+
+
+def _numeric(values):
+    if np is not None:
+        return np.fromiter(values, dtype=np.float64, count=len(values))
+    return array("d", values)
+
+
+def stream_users_columnar(batch_size=10000, columns=("user_id", "age")):
+    # Yields {column: values} per batch instead of one dict per row: numeric
+    # columns become float64 arrays, text columns plain lists.
+    unknown = [c for c in columns if c not in COLUMNS]
+    if unknown:
+        raise ValueError("unknown user_data columns: {}".format(", ".join(unknown)))
+
+    connection = connect_to_prodev()
+    try:
+        cursor = connection.cursor(buffered=False)
+        cursor.execute("SELECT {} FROM user_data".format(", ".join(columns)))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            batch = {}
+            for name, values in zip(columns, zip(*rows)):
+                batch[name] = _numeric(values) if name in NUMERIC_COLUMNS else list(values)
+            yield batch
+    finally:
+        connection.close()
+
+
+def age_histogram(bucket=10, batch_size=10000):
+    # Counts users per age bucket ({0: n, 10: n, ...}) from column batches.
+    counts = {}
+    for batch in stream_users_columnar(batch_size, columns=("age",)):
+        ages = batch["age"]
+        if np is not None:
+            buckets = (ages // bucket).astype(np.int64)
+            values, found = np.unique(buckets, return_counts=True)
+            pairs = zip(values.tolist(), found.tolist())
+        else:
+            pairs = {}
+            for age in ages:
+                key = int(age // bucket)
+                pairs[key] = pairs.get(key, 0) + 1
+            pairs = pairs.items()
+        for key, n in pairs:
+            counts[key * bucket] = counts.get(key * bucket, 0) + n
+    return dict(sorted(counts.items()))
+
+
+if __name__ == "__main__":
+    for start, n in age_histogram().items():
+        print("{:>3}-{:<3} {}".format(start, start + 9, n))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+from seed import connect_to_prodev
+
+COLUMNS = ("user_id", "name", "email", "age")
+# user_id holds UUID strings, so the keyspace is split on the leading hex
+# digits; each range is then a primary-key index range scan.
+KEYSPACE_DIGITS = 4
+
+
+def range_partitions(n):
+    keyspace = 16 ** KEYSPACE_DIGITS
+    bounds = ["{:0{}x}".format(i * keyspace // n, KEYSPACE_DIGITS) for i in range(1, n)]
+    return [("range", low, high) for low, high in zip([None] + bounds, bounds + [None])]
+
+
+def hash_partitions(n):
+    # Even split regardless of key distribution, but every worker scans the
+    # whole table to evaluate the hash.
+    return [("hash", n, i) for i in range(n)]
+
+
+def _where(partition):
+    kind, first, second = partition
+    if kind == "hash":
+        return "MOD(CRC32(user_id), %s) = %s", (first, second)
+    clauses, params = [], []
+    if first is not None:
+        clauses.append("user_id >= %s")
+        params.append(first)
+    if second is not None:
+        clauses.append("user_id < %s")
+        params.append(second)
+    return " AND ".join(clauses) or "1 = 1", tuple(params)
+
+
+def scan_partition(partition, columns=("age",), batch_size=10000):
+    where, params = _where(partition)
+    query = "SELECT {} FROM user_data WHERE {}".format(", ".join(columns), where)
+    connection = connect_to_prodev()
+    try:
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        connection.close()
+
+
+def _apply(job):
+    func, partition, columns, batch_size = job
+    return func(scan_partition(partition, columns, batch_size))
+
+
+def parallel_scan(func, reducer, initial, partitions=None, mode="range",
+                  columns=("age",), batch_size=10000):
+    # func(rows) runs in a worker process per partition, on that worker's own
+    # connection, and must be a module-level function; only its (small)
+    # return value travels back to be folded with reducer.
+    unknown = [c for c in columns if c not in COLUMNS]
+    if unknown:
+        raise ValueError("unknown user_data columns: {}".format(", ".join(unknown)))
+    if mode not in ("range", "hash"):
+        raise ValueError("mode must be 'range' or 'hash'")
+
+    n = partitions or os.cpu_count() or 1
+    parts = range_partitions(n) if mode == "range" else hash_partitions(n)
+    jobs = [(func, partition, tuple(columns), batch_size) for partition in parts]
+    with ProcessPoolExecutor(max_workers=n) as executor:
+        return reduce(reducer, executor.map(_apply, jobs), initial)
+
+
+def age_partial(rows):
+    count = 0
+    total = 0
+    for (age,) in rows:
+        count += 1
+        total += age
+    return count, total
+
+
+def merge_age_partials(left, right):
+    return left[0] + right[0], left[1] + right[1]
+
+
+def average_age_parallel(partitions=None, mode="range"):
+    count, total = parallel_scan(age_partial, merge_age_partials, (0, 0),
+                                 partitions=partitions, mode=mode)
+    average = float(total) / count if count else 0.0
+    return {"count": count, "sum": total, "average": average}
+
+
+if __name__ == "__main__":
+    print(average_age_parallel())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from seed import connect_to_prodev
+
+CHECKPOINT_FILE = "user_data.checkpoint"
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    return datetime.fromisoformat(state["updated_at"]), state["user_id"]
+
+
+def save_checkpoint(watermark, path=CHECKPOINT_FILE):
+    # Write a temp file next to the checkpoint and rename it over the old one,
+    # so a crash leaves either the previous or the new watermark, never half.
+    updated_at, user_id = watermark
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({"updated_at": updated_at.isoformat(), "user_id": user_id}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _fetch_changes(connection, watermark, batch_size, settle_seconds):
+    clauses, params = [], []
+    if watermark is not None:
+        # (updated_at, user_id) is the watermark so rows sharing a timestamp
+        # are neither skipped nor repeated across batch boundaries.
+        clauses.append("(updated_at > %s OR (updated_at = %s AND user_id > %s))")
+        params.extend([watermark[0], watermark[0], watermark[1]])
+    if settle_seconds:
+        # Leave the newest rows for the next run: a transaction still in
+        # flight may commit a row stamped slightly before them.
+        clauses.append("updated_at < NOW(6) - INTERVAL %s SECOND")
+        params.append(settle_seconds)
+    query = "SELECT * FROM user_data"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY updated_at, user_id LIMIT %s"
+    params.append(batch_size)
+    with connection.cursor(dictionary=True) as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def stream_changes(checkpoint_path=CHECKPOINT_FILE, batch_size=1000, settle_seconds=1):
+    # Yields rows inserted or updated since the stored watermark. The
+    # watermark advances only after a whole batch has been consumed, so a
+    # crashed run resumes at the start of the batch it was in
+    # (at-least-once delivery).
+    watermark = load_checkpoint(checkpoint_path)
+    connection = connect_to_prodev()
+    try:
+        while True:
+            rows = _fetch_changes(connection, watermark, batch_size, settle_seconds)
+            if not rows:
+                return
+            yield from rows
+            watermark = rows[-1]["updated_at"], rows[-1]["user_id"]
+            save_checkpoint(watermark, checkpoint_path)
+            if len(rows) < batch_size:
+                return
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    for row in stream_changes():
+        print(row)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# Compares the user_data streaming strategies on equal terms.
+#
+#   ./benchmark.py --backend sqlite --sizes 10000 100000 --batch-sizes 100 1000
+#   ./benchmark.py --backend mysql --database ALX_prodev_bench --output bench.json
+#
+# Every (strategy, size, batch size) run happens in a forked child so peak
+# RSS is not polluted by earlier runs. "round_trips" counts statements sent
+# to the server; "fetch_calls" counts fetchone/fetchmany/fetchall calls.
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import seed
+
+MODULES = ("0-stream_users", "1-batch_processing", "2-lazy_paginate", "4-stream_ages")
+
+
+def _flatten(batches):
+    for batch in batches:
+        yield from batch
+
+
+# name -> (uses batch size, factory(modules, batch_size) -> row iterator)
+STRATEGIES = {
+    "stream_users": (False, lambda m, n: m["0-stream_users"].stream_users()),
+    "stream_users_in_batches": (
+        True, lambda m, n: _flatten(m["1-batch_processing"].stream_users_in_batches(n))),
+    "stream_users_in_batches_prefetch": (
+        True, lambda m, n: _flatten(
+            m["1-batch_processing"].stream_users_in_batches(n, prefetch=True))),
+    "lazy_paginate": (True, lambda m, n: _flatten(m["2-lazy_paginate"].lazy_paginate(n))),
+    "lazy_paginate_offset": (
+        True, lambda m, n: _flatten(m["2-lazy_paginate"].lazy_paginate(n, mode="offset"))),
+    "stream_user_ages": (True, lambda m, n: m["4-stream_ages"].stream_user_ages(n)),
+}
+
+
+class Counters:
+    def __init__(self):
+        self.round_trips = 0
+        self.fetch_calls = 0
+
+
+class CountingCursor:
+    def __init__(self, cursor, counters):
+        self._cursor = cursor
+        self._counters = counters
+
+    def execute(self, query, params=()):
+        self._counters.round_trips += 1
+        return self._cursor.execute(query, params)
+
+    def executemany(self, query, seq):
+        self._counters.round_trips += 1
+        return self._cursor.executemany(query, seq)
+
+    def fetchone(self):
+        self._counters.fetch_calls += 1
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        self._counters.fetch_calls += 1
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        self._counters.fetch_calls += 1
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._cursor.close()
+
+
+class CountingConnection:
+    def __init__(self, connection, counters):
+        self._connection = connection
+        self._counters = counters
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._connection.cursor(*args, **kwargs), self._counters)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class SQLiteCursor:
+    # Just enough of the mysql.connector cursor API for the generator modules.
+    def __init__(self, cursor, dictionary):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip([d[0] for d in self._cursor.description], row))
+
+    def execute(self, query, params=()):
+        self._cursor.execute(query.replace("%s", "?"), tuple(params))
+
+    def executemany(self, query, seq):
+        self._cursor.executemany(query.replace("%s", "?"), seq)
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SQLiteConnection:
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+    def cursor(self, dictionary=False, buffered=None):
+        return SQLiteCursor(self._connection.cursor(), dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._connection.in_transaction
+
+    def is_connected(self):
+        return True
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+
+def _fake_rows(count):
+    rng = random.Random(count)
+    for i in range(count):
+        yield (str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+               "User {}".format(i), "user{}@example.com".format(i), rng.randint(1, 100))
+
+
+def seed_sqlite(path, size):
+    connection = sqlite3.connect(path)
+    connection.execute("DROP TABLE IF EXISTS user_data")
+    connection.execute("""CREATE TABLE user_data (
+        user_id TEXT PRIMARY KEY, name TEXT NOT NULL, email TEXT NOT NULL,
+        age INTEGER NOT NULL, updated_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
+    connection.executemany(
+        "INSERT INTO user_data (user_id, name, email, age) VALUES (?, ?, ?, ?)",
+        _fake_rows(size))
+    connection.commit()
+    connection.close()
+
+
+def seed_mysql(size, chunk=10000):
+    server = seed.connect_db()
+    seed.create_database(server)
+    server.close()
+    connection = seed.connect_to_prodev()
+    try:
+        seed.create_table(connection)
+        with connection.cursor() as cursor:
+            cursor.execute("TRUNCATE TABLE user_data")
+        rows = _fake_rows(size)
+        while True:
+            batch = list(itertools.islice(rows, chunk))
+            if not batch:
+                break
+            seed.insert_rows(connection, batch)
+    finally:
+        connection.close()
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return _peak_rss_bytes()
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _measure(strategy, batch_size, connect, conn_out):
+    modules = {name: __import__(name) for name in MODULES}
+    counters = Counters()
+    for module in modules.values():
+        module.connect_to_prodev = lambda: CountingConnection(connect(), counters)
+
+    baseline = _rss_bytes()
+    start = time.perf_counter()
+    first_row = None
+    rows = 0
+    for _ in STRATEGIES[strategy][1](modules, batch_size):
+        if first_row is None:
+            first_row = time.perf_counter() - start
+        rows += 1
+    elapsed = time.perf_counter() - start
+    conn_out.send({
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_sec": rows / elapsed if elapsed else 0.0,
+        "time_to_first_row": first_row,
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "rss_growth_bytes": max(0, _peak_rss_bytes() - baseline),
+        "round_trips": counters.round_trips,
+        "fetch_calls": counters.fetch_calls,
+    })
+    conn_out.close()
+
+
+def run_once(strategy, batch_size, connect):
+    context = multiprocessing.get_context("fork")
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=_measure, args=(strategy, batch_size, connect, child))
+    process.start()
+    child.close()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def _summarize(runs):
+    summary = {key: statistics.median(run[key] for run in runs)
+               for key in ("seconds", "rows_per_sec", "time_to_first_row",
+                           "peak_rss_bytes", "rss_growth_bytes")}
+    for key in ("rows", "round_trips", "fetch_calls"):
+        summary[key] = runs[0][key]
+    summary["runs"] = runs
+    return summary
+
+
+def run(backend, sizes, batch_sizes, strategies, repeat, database=None):
+    results = []
+    if backend == "mysql" and database:
+        seed.DB_NAME = database
+    with tempfile.TemporaryDirectory(prefix="user_data_bench-") as workdir:
+        for size in sizes:
+            if backend == "sqlite":
+                path = os.path.join(workdir, "user_data_{}.db".format(size))
+                seed_sqlite(path, size)
+                connect = lambda path=path: SQLiteConnection(path)
+            else:
+                seed_mysql(size)
+                connect = seed.connect_to_prodev
+            for strategy in strategies:
+                uses_batches = STRATEGIES[strategy][0]
+                for batch_size in (batch_sizes if uses_batches else [None]):
+                    runs = [run_once(strategy, batch_size, connect) for _ in range(repeat)]
+                    result = {"strategy": strategy, "table_rows": size, "batch_size": batch_size}
+                    result.update(_summarize(runs))
+                    results.append(result)
+                    print("{:<34} rows={:<9} batch={:<6} {:>12.0f} rows/s  ttfr={:.4f}s".format(
+                        strategy, size, str(batch_size), result["rows_per_sec"],
+                        result["time_to_first_row"] or 0.0), file=sys.stderr)
+    return {
+        "meta": {
+            "backend": backend,
+            "database": seed.DB_NAME if backend == "mysql" else None,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=("sqlite", "mysql"), default="sqlite")
+    parser.add_argument("--database", default="ALX_prodev_bench",
+                        help="MySQL database to seed (it is truncated)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--strategies", nargs="+", choices=sorted(STRATEGIES),
+                        default=list(STRATEGIES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args.backend, args.sizes, args.batch_sizes, args.strategies,
+                 args.repeat, args.database)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
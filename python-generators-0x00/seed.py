@@ -1,12 +1,165 @@
 #!/usr/bin/env python3
 
+import contextlib
+import csv
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
 from mysql.connector import connect, Error
+from mysql.connector.errors import PoolError
 
 DB_HOST = 'localhost'
 DB_USER = 'root'
 DB_PASSWORD = 'password'
 DB_NAME = 'ALX_prodev'
 
+INSERT_QUERY = '''INSERT INTO user_data (user_id, name, email, age)
+                  VALUES (%s, %s, %s, %s)'''
+ID_FIELDS = ('user_id', 'uuid')
+
+POOL_SIZE = 5
+POOL_IDLE_TIMEOUT = 300
+POOL_CHECKOUT_TIMEOUT = 30
+
+
+class PooledConnection:
+    # Behaves like the wrapped connection, but close() hands it back to the
+    # pool instead of tearing down the TCP session.
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise PoolError('connection was already returned to the pool')
+        return getattr(self._connection, name)
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 checkout_timeout=POOL_CHECKOUT_TIMEOUT, **options):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.options = dict(host=DB_HOST, user=DB_USER, password=DB_PASSWORD,
+                            database=DB_NAME, **options)
+        self.pid = os.getpid()
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def get(self):
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolError('no connection available after {}s'.format(self.checkout_timeout))
+        try:
+            return PooledConnection(self, self._checkout())
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                expired = self._expired()
+                connection = self._idle.pop()[0] if self._idle else None
+            for stale in expired:
+                self._discard(stale)
+            if connection is None:
+                break
+            if connection.is_connected():
+                return connection
+            self._discard(connection)
+        return connect(**self.options)
+
+    def _expired(self):
+        # Checkout takes the most recently used connection from the right,
+        # so the ones that have idled longest collect on the left; drop them
+        # from there before the server times them out. Caller holds _lock.
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+        while self._idle and self._idle[0][1] < cutoff:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def release(self, connection):
+        try:
+            # A half-read unbuffered result or an open transaction would leak
+            # into the next checkout, so clean up or drop the connection.
+            if getattr(connection, 'unread_result', False):
+                self._discard(connection)
+                return
+            if connection.in_transaction:
+                connection.rollback()
+            with self._lock:
+                self._idle.append((connection, time.monotonic()))
+                expired = self._expired()
+            for stale in expired:
+                self._discard(stale)
+        except Error:
+            self._discard(connection)
+        finally:
+            self._slots.release()
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure_pool(**settings):
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, ConnectionPool(**settings)
+    if old is not None:
+        old.close()
+    return _pool
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        # A forked child must not share the parent's sockets.
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool()
+        return _pool
+
+
+@contextlib.contextmanager
+def pooled_connection():
+    connection = get_pool().get()
+    try:
+        yield connection
+    finally:
+        connection.close()
+
 def connect_db():
     try:
         return connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD)
@@ -23,9 +176,13 @@ def create_database(connection):
         print(e)
 
 
-def connect_to_prodev():
+def connect_to_prodev(**options):
+    # Connections with custom options are not interchangeable, so only the
+    # plain ones come from the shared pool.
     try:
-        return connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+        if options:
+            return connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME, **options)
+        return get_pool().get()
     except Error as e:
         print(e)
 
@@ -35,39 +192,157 @@ def create_table(connection):
                 user_id VARCHAR(255) PRIMARY KEY, 
                 name VARCHAR(255) NOT NULL, 
                 email VARCHAR(255) NOT NULL,
-                age DECIMAL NOT NULL
+                age DECIMAL NOT NULL,
+                updated_at TIMESTAMP(6) NOT NULL
+                    DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+                INDEX idx_user_data_updated_at (updated_at, user_id)
             )'''
     try:
         with connection.cursor() as cursor:
             cursor.execute(query)
+        add_updated_at(connection)
     except Error as e:
         print(e)
 
 
+def add_updated_at(connection):
+    # Brings tables created before the change feed up to the current schema.
+    query = """SELECT COUNT(*) FROM information_schema.COLUMNS
+               WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user_data'
+               AND COLUMN_NAME = 'updated_at'"""
+    with connection.cursor() as cursor:
+        cursor.execute(query)
+        (exists,) = cursor.fetchone()
+        if not exists:
+            cursor.execute('''ALTER TABLE user_data
+                ADD COLUMN updated_at TIMESTAMP(6) NOT NULL
+                    DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+                ADD INDEX idx_user_data_updated_at (updated_at, user_id)''')
+
+
+def _to_row(record):
+    user_id = next((record[f] for f in ID_FIELDS if record.get(f)), None)
+    return (user_id or str(uuid.uuid4()), record['name'], record['email'], record['age'])
+
+
 def insert_data(connection, data):
-    query = f'''
-            INSERT INTO user_data VALUES
-            ("{data['uuid']}", "{data['name']}", "{data['email']}", {data['age']})
-            '''
     try:
-        with connection.cursor() as cursor:
-            cursor.execute(query)
+        insert_rows(connection, [_to_row(data)])
     except Error as e:
         print(e)
 
 
+def insert_rows(connection, rows):
+    # One parameterized executemany and one commit for the whole chunk;
+    # a failing chunk is rolled back as a whole and the error re-raised.
+    try:
+        with connection.cursor() as cursor:
+            cursor.executemany(INSERT_QUERY, rows)
+        connection.commit()
+    except Error:
+        connection.rollback()
+        raise
+    return len(rows)
+
+
+def read_records(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def local_infile_enabled(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW VARIABLES LIKE 'local_infile'")
+            row = cursor.fetchone()
+        return bool(row) and str(row[1]).upper() in ('ON', '1')
+    except Error:
+        return False
+
+
+def load_data_infile(connection, path):
+    # The server parses the CSV itself; the connection must have been opened
+    # with allow_local_infile=True.
+    with open(path, newline='', encoding='utf-8') as f:
+        first_line = f.readline()
+    header = next(csv.reader([first_line]))
+    # Files written on Windows end lines with CRLF; splitting on '\n' alone
+    # would leave a '\r' on the last column of every row.
+    terminator = '\\r\\n' if first_line.endswith('\r\n') else '\\n'
+    columns = []
+    for name in header:
+        name = name.strip()
+        if name in ID_FIELDS:
+            columns.append('user_id')
+        elif name in ('name', 'email', 'age'):
+            columns.append(name)
+        else:
+            columns.append('@skip')
+    query = '''LOAD DATA LOCAL INFILE %s INTO TABLE user_data
+               FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+               LINES TERMINATED BY '{}' IGNORE 1 LINES ({})'''.format(terminator, ', '.join(columns))
+    if 'user_id' not in columns:
+        query += ' SET user_id = UUID()'
+    with connection.cursor() as cursor:
+        cursor.execute(query, (path,))
+        loaded = cursor.rowcount
+    connection.commit()
+    return loaded
+
+
+def _report(method, rows, start, final=False):
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed else 0.0
+    print('{}{}: {} rows in {:.1f}s ({:.0f} rows/s)'.format(
+        '' if final else '  ', method, rows, elapsed, rate), file=sys.stderr)
+    return {'method': method, 'rows': rows, 'seconds': elapsed, 'rows_per_sec': rate}
+
+
+def bulk_load(connection, path, batch_size=10000, use_infile=True):
+    start = time.perf_counter()
+    if use_infile and path.endswith('.csv') and local_infile_enabled(connection):
+        try:
+            return _report('load_data_infile', load_data_infile(connection, path), start, True)
+        except Error as e:
+            connection.rollback()
+            print(e)
+
+    rows = (_to_row(record) for record in read_records(path))
+    total = 0
+    while True:
+        chunk = list(itertools.islice(rows, batch_size))
+        if not chunk:
+            break
+        try:
+            total += insert_rows(connection, chunk)
+        except Error:
+            # Earlier chunks are committed; say how far the load got.
+            print('executemany: failed after {} rows'.format(total), file=sys.stderr)
+            raise
+        _report('executemany', total, start)
+    return _report('executemany', total, start, True)
+
+
 if __name__ == '__main__':
     conn1 = connect_db()
     create_database(conn1)
-    conn2 = connect_to_prodev()
+    conn2 = connect_to_prodev(allow_local_infile=True)
     create_table(conn2)
-    insert_data(conn2,
-        {
-            "uuid": "2cb9e2c9-bc99-4ed0-b203-4c7f35733578",
-            "name": "Ernest Wambua",
-            "email": "ernest@example.com",
-            "age": 24
-        }
-    )
+    if len(sys.argv) > 1:
+        bulk_load(conn2, sys.argv[1])
+    else:
+        insert_data(conn2,
+            {
+                "uuid": "2cb9e2c9-bc99-4ed0-b203-4c7f35733578",
+                "name": "Ernest Wambua",
+                "email": "ernest@example.com",
+                "age": 24
+            }
+        )
     conn1.close()
     conn2.close()
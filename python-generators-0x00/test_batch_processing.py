@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock, patch
+
+from mysql.connector import Error
+
+batch_processing = __import__('1-batch_processing')
+
+
+class TestStreamUsersInBatches(unittest.TestCase):
+    def setUp(self):
+        self.connection = MagicMock()
+        self.cursor = self.connection.cursor.return_value
+        self.cursor.fetchmany.side_effect = [[{'age': 30}], Error('lost connection'), []]
+        patcher = patch.object(batch_processing, 'connect_to_prodev', return_value=self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prefetch_raises_database_errors(self):
+        batches = []
+        with self.assertRaises(Error):
+            for batch in batch_processing.stream_users_in_batches(1, prefetch=True):
+                batches.append(batch)
+        self.assertEqual(batches, [[{'age': 30}]])
+        self.connection.close.assert_called_once_with()
+
+    def test_without_prefetch_errors_are_reported(self):
+        with redirect_stdout(io.StringIO()) as output:
+            batches = list(batch_processing.stream_users_in_batches(1))
+        self.assertEqual(batches, [[{'age': 30}]])
+        self.assertIn('lost connection', output.getvalue())
+        self.connection.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
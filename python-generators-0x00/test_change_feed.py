@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+change_feed = __import__('7-change_feed')
+
+
+def row(user_id, second):
+    return {'user_id': user_id, 'updated_at': datetime(2024, 1, 1, 0, 0, second)}
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'feed.checkpoint')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_missing_checkpoint(self):
+        self.assertIsNone(change_feed.load_checkpoint(self.path))
+
+    def test_round_trip(self):
+        watermark = (datetime(2024, 1, 1, 12, 30, 0, 123456), 'b')
+        change_feed.save_checkpoint((datetime(2024, 1, 1), 'a'), self.path)
+        change_feed.save_checkpoint(watermark, self.path)
+        self.assertEqual(change_feed.load_checkpoint(self.path), watermark)
+        self.assertEqual(os.listdir(self.directory.name), ['feed.checkpoint'])
+
+    def test_failed_write_keeps_previous_checkpoint(self):
+        watermark = (datetime(2024, 1, 1), 'a')
+        change_feed.save_checkpoint(watermark, self.path)
+        with self.assertRaises(TypeError):
+            change_feed.save_checkpoint((datetime(2024, 1, 2), object()), self.path)
+        self.assertEqual(change_feed.load_checkpoint(self.path), watermark)
+        self.assertEqual(os.listdir(self.directory.name), ['feed.checkpoint'])
+
+
+class TestStreamChanges(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'feed.checkpoint')
+        self.connection = MagicMock()
+        self.cursor = self.connection.cursor.return_value.__enter__.return_value
+        self.cursor.fetchall.side_effect = [[row('a', 1), row('b', 1)], [row('c', 2)]]
+        patcher = patch.object(change_feed, 'connect_to_prodev', return_value=self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_watermark_advances_after_each_full_batch(self):
+        changes = change_feed.stream_changes(self.path, batch_size=2)
+        self.assertEqual(next(changes)['user_id'], 'a')
+        self.assertEqual(next(changes)['user_id'], 'b')
+        # The last row of the batch was handed out, but not yet processed.
+        self.assertIsNone(change_feed.load_checkpoint(self.path))
+        self.assertEqual(next(changes)['user_id'], 'c')
+        self.assertEqual(change_feed.load_checkpoint(self.path), (row('b', 1)['updated_at'], 'b'))
+        self.assertEqual(list(changes), [])
+        self.assertEqual(change_feed.load_checkpoint(self.path), (row('c', 2)['updated_at'], 'c'))
+        self.connection.close.assert_called_once_with()
+
+    def test_abandoned_batch_is_redelivered(self):
+        changes = change_feed.stream_changes(self.path, batch_size=2)
+        next(changes)
+        changes.close()
+        self.assertIsNone(change_feed.load_checkpoint(self.path))
+        self.connection.close.assert_called_once_with()
+
+    def test_resumes_from_checkpoint(self):
+        watermark = (datetime(2024, 1, 1), 'z')
+        change_feed.save_checkpoint(watermark, self.path)
+        list(change_feed.stream_changes(self.path, batch_size=2))
+        query, params = self.cursor.execute.call_args_list[0][0]
+        self.assertIn('updated_at > %s', query)
+        self.assertEqual(params[:3], [watermark[0], watermark[0], 'z'])
+
+
+if __name__ == '__main__':
+    unittest.main()
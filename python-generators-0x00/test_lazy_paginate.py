@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+import base64
+import json
+import unittest
+
+lazy_paginate = __import__('2-lazy_paginate')
+
+
+def raw_token(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+class TestPageToken(unittest.TestCase):
+    def test_round_trip(self):
+        for state in ({"mode": "keyset", "after": None, "offset": 0},
+                      {"mode": "offset", "after": "a1b2", "offset": 200}):
+            token = lazy_paginate.encode_token(state)
+            self.assertEqual(lazy_paginate.decode_token(token), state)
+
+    def test_malformed_tokens_are_rejected(self):
+        tokens = ["not base64!", raw_token([1, 2]), raw_token({"mode": "scan"})]
+        tokens += [raw_token(state) for state in (
+            {"mode": "keyset", "offset": 0},
+            {"mode": "keyset", "after": None},
+            {"mode": "keyset", "after": 7, "offset": 0},
+            {"mode": "offset", "after": None, "offset": "100"},
+            {"mode": "offset", "after": None, "offset": True},
+            {"mode": "offset", "after": None, "offset": -1},
+        )]
+        for token in tokens:
+            with self.assertRaises(ValueError):
+                lazy_paginate.decode_token(token)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import seed
+from mysql.connector import Error
+from mysql.connector.errors import PoolError
+
+
+class TestBulkLoad(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'users.csv')
+        with open(self.path, 'w') as f:
+            f.write('name,email,age\n')
+            for i in range(5):
+                f.write('user{0},user{0}@example.com,{1}\n'.format(i, 20 + i))
+        self.connection = MagicMock()
+        self.cursor = self.connection.cursor.return_value.__enter__.return_value
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_loads_every_chunk(self):
+        report = seed.bulk_load(self.connection, self.path, batch_size=2, use_infile=False)
+        self.assertEqual(report['rows'], 5)
+        self.assertEqual(self.cursor.executemany.call_count, 3)
+        self.assertEqual(self.connection.commit.call_count, 3)
+
+    def test_failed_chunk_is_rolled_back_and_raised(self):
+        self.cursor.executemany.side_effect = [None, Error('duplicate entry'), None]
+        with self.assertRaises(Error):
+            seed.bulk_load(self.connection, self.path, batch_size=2, use_infile=False)
+        self.assertEqual(self.connection.commit.call_count, 1)
+        self.connection.rollback.assert_called_once_with()
+
+    def test_insert_data_reports_errors(self):
+        self.cursor.executemany.side_effect = Error('duplicate entry')
+        seed.insert_data(self.connection, {'name': 'a', 'email': 'a@example.com', 'age': 1})
+        self.connection.rollback.assert_called_once_with()
+
+    def test_load_data_infile_matches_line_endings(self):
+        for ending, terminator in (('\n', "'\\n'"), ('\r\n', "'\\r\\n'")):
+            with open(self.path, 'w', newline='') as f:
+                f.write('name,email,age' + ending + 'a,a@example.com,1' + ending)
+            self.cursor.reset_mock()
+            seed.load_data_infile(self.connection, self.path)
+            query = self.cursor.execute.call_args[0][0]
+            self.assertIn('LINES TERMINATED BY ' + terminator, query)
+            self.assertIn('(name, email, age)', query)
+
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(seed, 'connect', side_effect=lambda **options: MagicMock(
+            unread_result=False, in_transaction=False))
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = seed.ConnectionPool(size=1, idle_timeout=60, checkout_timeout=0.05)
+
+    def test_connection_is_reused(self):
+        with self.pool.get() as first:
+            connection = first._connection
+        with self.pool.get() as second:
+            self.assertIs(second._connection, connection)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_unread_result_is_discarded(self):
+        connection = self.pool.get()
+        raw = connection._connection
+        raw.unread_result = True
+        connection.close()
+        raw.close.assert_called_once_with()
+        self.assertEqual(len(self.pool._idle), 0)
+
+    def test_open_transaction_is_rolled_back_on_release(self):
+        connection = self.pool.get()
+        raw = connection._connection
+        raw.in_transaction = True
+        connection.close()
+        raw.rollback.assert_called_once_with()
+        self.assertEqual([entry[0] for entry in self.pool._idle], [raw])
+
+    def test_checkout_times_out_when_exhausted(self):
+        connection = self.pool.get()
+        with self.assertRaises(PoolError):
+            self.pool.get()
+        connection.close()
+        self.pool.get().close()
+
+    def test_expired_idle_connections_are_pruned(self):
+        stale, fresh = MagicMock(), MagicMock()
+        self.pool._idle.append((stale, time.monotonic() - 120))
+        self.pool._idle.append((fresh, time.monotonic()))
+        connection = self.pool.get()
+        self.assertIs(connection._connection, fresh)
+        # Never popped, but closed all the same.
+        stale.close.assert_called_once_with()
+        self.assertEqual(len(self.pool._idle), 0)
+
+    def test_forked_child_gets_its_own_pool(self):
+        self.addCleanup(setattr, seed, '_pool', seed._pool)
+        parent = seed.get_pool()
+        self.assertIs(seed.get_pool(), parent)
+        with patch.object(seed.os, 'getpid', return_value=parent.pid + 1):
+            self.assertIsNot(seed.get_pool(), parent)
+
+
+if __name__ == '__main__':
+    unittest.main()